@@ -0,0 +1,292 @@
+# Reproducible end-to-end benchmark: explores and replays the bundled test application with a fixed
+# seed and without the LLM, and stores the results so that runs before and after a change can be compared
+
+import argparse
+import functools
+import json
+import os
+import random
+import socket
+import subprocess
+import threading
+import time
+import uuid
+import numpy as np
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from Browser import LeanProfile, WaitPolicy, install_error_hook
+from Coverage import CoverageIndex
+from Errors import ErrorIndex
+from Explore import WebAppEnv, create_driver, new_state_reward, new_transition_reward, terminate_chromedriver_processes
+from Profiler import StepProfiler
+from Replay import default_workers, find_scripts, run_replays, script_timeout, write_report
+from SampleValues import LlamaCache, SampleValueGenerator
+
+# Define the folder of the bundled test application and the port it is served on
+benchmark_app_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark-app")
+default_port = 8765
+
+# Define where every benchmark run keeps its files and where the results of all runs are appended
+results_dir = "./benchmark-results"
+results_file = os.path.join(results_dir, "results.jsonl")
+
+# Define the default exploration budget
+default_seed = 1
+default_steps = 300
+default_episode_steps = 50
+
+# Errors seeded into the test application, each with a piece of its message (matched case-insensitively
+# against the error signatures) so a run reports which of them it found
+seeded_errors = {
+    "checkout_missing_shipping_rate": "'total'",
+    "booking_unhandled_rejection": "availability lookup failed",
+    "plans_undefined_quote": "enterprisequote is not defined",
+    "orders_cancelled_delete": "delete cancelled",
+    "reports_error_text": "unhandled exception",
+    "catalog_missing_endpoint": "status of 404"
+}
+
+# Metrics compared between runs, and whether a higher value is better
+compared_metrics = [
+    ("exploration", "states_per_minute", True),
+    ("exploration", "steps_per_second", True),
+    ("exploration", "webdriver_commands_per_step", False),
+    ("exploration", "time_to_first_error", False),
+    ("exploration", "unique_errors", True),
+    ("exploration", "seeded_errors_found", True),
+    ("exploration", "known_states", True),
+    ("replay", "scripts_per_minute", True),
+    ("replay", "actions_per_second", True)
+]
+
+# Request handler serving the test application without logging every request
+class QuietRequestHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+# Local HTTP server for the bundled test application, running on a background thread
+class TestAppServer:
+    def __init__(self, directory=benchmark_app_dir, port=default_port):
+        self.directory = directory
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/index.html"
+
+    def start(self):
+        handler = functools.partial(QuietRequestHandler, directory=self.directory)
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        print(f"Serving the test application at {self.url}")
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+# Function to find a free local port, so the benchmark browser does not share a debugging port with a running exploration
+def get_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# Function to get the current commit, so results can be matched to the code that produced them
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Function to list the seeded errors whose message appears in the found error signatures
+def get_seeded_errors_found(report):
+    signatures = [error["signature"].lower() for error in report]
+    return sorted(name for name, fragment in seeded_errors.items() if any(fragment in signature for signature in signatures))
+
+# Function to explore the application with random actions from a fixed seed for a number of steps.
+# Every run starts with an empty LLM cache, coverage index, error index and browser profile of its own,
+# and fields are filled with rule-based values, so runs with the same seed take the same decisions.
+def run_exploration(url, run_dir, seed, steps, episode_steps, settle_timeout, quiet_window, lean_profile=None):
+    random.seed(seed)
+    np.random.seed(seed)
+
+    value_generator = SampleValueGenerator(LlamaCache(os.path.join(run_dir, "llama_cache.sqlite")), None)
+    coverage = CoverageIndex(os.path.join(run_dir, "coverage.sqlite"), new_state_reward, new_transition_reward)
+    error_index_path = os.path.join(run_dir, "error_index.sqlite")
+    error_index = ErrorIndex(error_index_path)
+    driver = create_driver(0, lean_profile, user_data_dir=os.path.join(run_dir, "chrome-profile"), debugging_port=get_free_port())
+    install_error_hook(driver)
+    wait_policy = WaitPolicy(settle_timeout, quiet_window)
+    wait_policy.install(driver)
+    profiler = StepProfiler()
+    profiler.instrument(driver)
+
+    env = WebAppEnv(driver, value_generator, coverage, error_index, url, run_dir, 0, wait_policy, profiler)
+    env.action_space.seed(seed)
+
+    episodes = 1
+    episode_step = 0
+    time_to_first_error = None
+    start_time = time.perf_counter()
+    for _ in range(steps):
+        _, _, done, _ = env.step(env.action_space.sample())
+        if time_to_first_error is None and error_index.new_signatures > 0:
+            time_to_first_error = time.perf_counter() - start_time
+        episode_step += 1
+        if done or episode_step >= episode_steps:
+            env.reset()
+            episodes += 1
+            episode_step = 0
+    wall_time = time.perf_counter() - start_time
+
+    profile = profiler.summary()
+    coverage_stats = coverage.stats()
+    env.close()
+
+    error_index = ErrorIndex(error_index_path)
+    report = error_index.export_report(os.path.join(run_dir, "error_report.json"))
+    error_index.close()
+    seeded_errors_found = get_seeded_errors_found(report)
+
+    return {
+        "steps": steps,
+        "episodes": episodes,
+        "wall_time": round(wall_time, 3),
+        "steps_per_second": round(steps / wall_time, 3) if wall_time > 0 else 0.0,
+        "webdriver_commands_per_step": profile["sections"]["webdriver_commands"]["mean"],
+        "step_p50": profile["sections"]["step"]["p50"],
+        "step_p90": profile["sections"]["step"]["p90"],
+        "time_to_first_error": round(time_to_first_error, 3) if time_to_first_error is not None else None,
+        "unique_errors": len(report),
+        "error_occurrences": sum(error["occurrences"] for error in report),
+        "seeded_errors_found": len(seeded_errors_found),
+        "seeded_errors": seeded_errors_found,
+        "states_per_minute": round(coverage_stats["new_states"] / wall_time * 60, 2) if wall_time > 0 else 0.0,
+        "known_states": coverage_stats["known_states"],
+        "known_transitions": coverage_stats["known_transitions"]
+    }
+
+# Function to replay every trace recorded by the exploration and measure the replay throughput
+def run_replay(url, run_dir, workers, timeout, settle_timeout, quiet_window, lean_profile=None):
+    script_file_paths = find_scripts(run_dir)
+    replay_dir = os.path.join(run_dir, "replay")
+    if not os.path.exists(replay_dir):
+        os.makedirs(replay_dir)
+
+    start_time = time.perf_counter()
+    results = run_replays(script_file_paths, workers, url, replay_dir, timeout, WaitPolicy(settle_timeout, quiet_window), lean_profile)
+    wall_time = time.perf_counter() - start_time
+    report = write_report(results, os.path.join(replay_dir, "replay_report.json"), wall_time, workers)
+
+    actions = sum(result["actions"] for result in results)
+    return {
+        "scripts": len(results),
+        "actions": actions,
+        "workers": workers,
+        "wall_time": round(wall_time, 3),
+        "scripts_per_minute": report["scripts_per_minute"],
+        "actions_per_second": round(actions / wall_time, 3) if wall_time > 0 else 0.0,
+        "summary": report["summary"]
+    }
+
+# Function to read the results of earlier runs
+def read_results(path):
+    results = []
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    results.append(json.loads(line))
+    return results
+
+# Function to print the metrics of a run next to the last earlier run with the same configuration
+def compare_results(result, previous_results):
+    previous = None
+    for candidate in reversed(previous_results):
+        if candidate["config"] == result["config"]:
+            previous = candidate
+            break
+
+    if previous is None:
+        print("No earlier run with the same configuration to compare with")
+    else:
+        print(f"Compared with run {previous['run_id']} ({previous['label'] or previous['commit']}, {previous['time']})")
+    for section, metric, higher_is_better in compared_metrics:
+        value = result.get(section, {}).get(metric)
+        previous_value = previous.get(section, {}).get(metric) if previous is not None else None
+        line = f"{section + '.' + metric:<45} {value if value is not None else '-':>12}"
+        if previous is not None:
+            line += f" {previous_value if previous_value is not None else '-':>12}"
+            if value is not None and previous_value:
+                change = (value - previous_value) / previous_value * 100
+                better = change > 0 if higher_is_better else change < 0
+                line += f" {change:+8.1f}%{'' if change == 0 else ' (better)' if better else ' (worse)'}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Explore and replay the bundled test application with a fixed seed and compare the results with earlier runs")
+    parser.add_argument("--seed", type=int, default=default_seed, help="Seed for the random actions of the exploration")
+    parser.add_argument("--steps", type=int, default=default_steps, help="Number of exploration steps")
+    parser.add_argument("--episode-steps", type=int, default=default_episode_steps, help="Number of steps before an episode is reset")
+    parser.add_argument("--port", type=int, default=default_port, help="Port the test application is served on")
+    parser.add_argument("--replay-workers", type=int, default=default_workers, help="Number of browsers replaying the recorded traces; 0 skips the replay")
+    parser.add_argument("--timeout", type=float, default=script_timeout, help="Maximum time in seconds for replaying one trace")
+    parser.add_argument("--settle-timeout", type=float, default=10.0, help="Maximum seconds to wait for the page to settle after each action; 0 disables waiting")
+    parser.add_argument("--quiet-window", type=float, default=0.25, help="Seconds without requests or DOM changes before the page counts as settled")
+    parser.add_argument("--lean", action="store_true", help="Run the browsers with the lean profile")
+    parser.add_argument("--label", default="", help="Name stored with the results, such as the change being measured")
+    parser.add_argument("--results", default=results_file, help="File the results of every run are appended to")
+    parser.add_argument("--serve", action="store_true", help="Only serve the test application until interrupted")
+    args = parser.parse_args()
+
+    server = TestAppServer(port=args.port)
+    server.start()
+    try:
+        if args.serve:
+            while True:
+                time.sleep(1)
+
+        terminate_chromedriver_processes()
+        run_id = time.strftime("%Y%m%d%H%M%S") + "_" + uuid.uuid4().hex[:8]
+        run_dir = os.path.join(results_dir, run_id)
+        os.makedirs(run_dir)
+        lean_profile = LeanProfile() if args.lean else None
+
+        result = {
+            "run_id": run_id,
+            "label": args.label,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "commit": get_commit(),
+            "config": {
+                "seed": args.seed,
+                "steps": args.steps,
+                "episode_steps": args.episode_steps,
+                "replay_workers": args.replay_workers,
+                "settle_timeout": args.settle_timeout,
+                "quiet_window": args.quiet_window,
+                "lean": args.lean
+            }
+        }
+        result["exploration"] = run_exploration(server.url, run_dir, args.seed, args.steps, args.episode_steps, args.settle_timeout, args.quiet_window, lean_profile)
+        if args.replay_workers > 0:
+            result["replay"] = run_replay(server.url, run_dir, args.replay_workers, args.timeout, args.settle_timeout, args.quiet_window, lean_profile)
+
+        previous_results = read_results(args.results)
+        results_folder = os.path.dirname(args.results)
+        if results_folder and not os.path.exists(results_folder):
+            os.makedirs(results_folder)
+        with open(args.results, "a") as f:
+            f.write(json.dumps(result) + "\n")
+        print(f"Benchmark results saved to {args.results} (run {run_id})")
+        compare_results(result, previous_results)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,582 @@
+# Browser helpers shared by the explorer and the replayer
+
+import hashlib
+import json
+import os
+import time
+import psutil
+from urllib.parse import urlparse
+from selenium.common.exceptions import UnexpectedAlertPresentException, WebDriverException
+
+# Script installed in every document to track when the page is busy.
+# It counts fetch and XMLHttpRequest calls that have not finished yet and records the time of the
+# last network change or DOM mutation, so a page counts as settled once it is loaded, has no
+# requests in flight and has not changed for a quiet window.
+settle_hook_script = """
+(function () {
+    if (window.__webDogSettle) {
+        return;
+    }
+    var settle = window.__webDogSettle = {pending: 0, lastChange: performance.now()};
+    var touch = function () {
+        settle.lastChange = performance.now();
+    };
+    var finish = function () {
+        settle.pending = Math.max(settle.pending - 1, 0);
+        touch();
+    };
+
+    if (window.fetch) {
+        var originalFetch = window.fetch;
+        window.fetch = function () {
+            settle.pending++;
+            touch();
+            var request;
+            try {
+                request = originalFetch.apply(this, arguments);
+            } catch (e) {
+                finish();
+                throw e;
+            }
+            request.then(finish, finish);
+            return request;
+        };
+    }
+
+    var originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        settle.pending++;
+        touch();
+        this.addEventListener('loadend', finish);
+        try {
+            return originalSend.apply(this, arguments);
+        } catch (e) {
+            this.removeEventListener('loadend', finish);
+            finish();
+            throw e;
+        }
+    };
+
+    new MutationObserver(touch).observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+})();
+"""
+
+# Asynchronous script that polls inside the page until it has settled or the timeout is reached,
+# so waiting costs a single WebDriver call instead of one call per poll
+settle_wait_script = settle_hook_script + """
+var options = arguments[0];
+var callback = arguments[arguments.length - 1];
+var settle = window.__webDogSettle;
+var start = performance.now();
+(function poll() {
+    var now = performance.now();
+    var ready = document.readyState === 'complete' || (options.interactive && document.readyState === 'interactive');
+    var idle = !options.network || settle.pending === 0;
+    var quiet = now - settle.lastChange >= options.quiet_window;
+    if ((ready && idle && quiet) || now - start >= options.timeout) {
+        callback({settled: ready && idle && quiet, ready_state: document.readyState, pending: settle.pending});
+        return;
+    }
+    setTimeout(poll, options.poll_interval);
+})();
+"""
+
+# Policy deciding how long to wait for the page to settle after navigating or performing an action.
+# timeout: maximum wait in seconds; 0 disables waiting
+# quiet_window: seconds without network activity or DOM mutations before the page counts as settled
+# wait_for_network: whether fetch and XMLHttpRequest calls in flight keep the page busy
+# interactive: whether an interactive document is ready enough, instead of waiting for all resources
+class WaitPolicy:
+    def __init__(self, timeout=10.0, quiet_window=0.25, poll_interval=0.05, wait_for_network=True, interactive=False):
+        self.timeout = timeout
+        self.quiet_window = quiet_window
+        self.poll_interval = poll_interval
+        self.wait_for_network = wait_for_network
+        self.interactive = interactive
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+
+    # Function to inject the settle hook into every document the browser loads from now on
+    def install(self, driver):
+        if self.timeout <= 0:
+            return
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": settle_hook_script})
+        driver.set_script_timeout(self.timeout + 5)
+
+    # Function to wait until the page has settled, returning whether it did.
+    # A page that navigates while waiting is waited for again until the timeout.
+    def wait(self, driver):
+        if self.timeout <= 0:
+            return True
+
+        start_time = time.perf_counter()
+        deadline = start_time + self.timeout
+        settled = False
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            options = {
+                "timeout": remaining * 1000,
+                "quiet_window": self.quiet_window * 1000,
+                "poll_interval": self.poll_interval * 1000,
+                "network": self.wait_for_network,
+                "interactive": self.interactive
+            }
+            try:
+                settled = driver.execute_async_script(settle_wait_script, options)["settled"]
+                break
+            except UnexpectedAlertPresentException:
+                # An open alert blocks the page; leave it for the caller to handle
+                break
+            except WebDriverException:
+                # The document was replaced while waiting
+                time.sleep(self.poll_interval)
+
+        self.waits += 1
+        self.wait_time += time.perf_counter() - start_time
+        if not settled:
+            self.timeouts += 1
+        return settled
+
+    def stats(self):
+        return {
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+            "average_wait": round(self.wait_time / self.waits, 4) if self.waits else 0.0
+        }
+
+# Define the page text that counts as an error when it appears, as case-insensitive regular expressions
+default_error_patterns = ["unhandled exception"]
+
+# Script installed in every document to collect errors inside the page instead of scanning it after each step.
+# Uncaught errors, unhandled promise rejections, console.error calls and added page text matching one
+# of the error patterns are buffered in window.__webDogErrors until the next snapshot drains them.
+# Uncaught errors are worded like Chrome's console log ("<url> <line>:<column> <message>") so both
+# sources lead to the same error signature.
+error_hook_script = """
+(function (patterns) {
+    if (window.__webDogErrors) {
+        return;
+    }
+    var errors = window.__webDogErrors = [];
+    var reported = {};
+    var report = function (type, message) {
+        message = String(message).slice(0, 2000);
+        if (!reported[message]) {
+            reported[message] = true;
+            errors.push({type: type, message: message});
+        }
+    };
+
+    window.addEventListener('error', function (event) {
+        if (event.error !== undefined || event.message) {
+            report('error', (event.filename || '') + ' ' + (event.lineno || 0) + ':' + (event.colno || 0) + ' ' + event.message);
+        }
+    });
+    window.addEventListener('unhandledrejection', function (event) {
+        var reason = event.reason;
+        report('rejection', 'Uncaught (in promise) ' + (reason && (reason.stack || reason.message) || String(reason)));
+    });
+
+    var originalError = console.error;
+    console.error = function () {
+        report('console', Array.prototype.map.call(arguments, function (argument) {
+            return argument && argument.stack ? argument.stack : String(argument);
+        }).join(' '));
+        return originalError.apply(this, arguments);
+    };
+
+    var expressions = patterns.map(function (pattern) {
+        return new RegExp(pattern, 'i');
+    });
+    var checkText = function (text) {
+        if (!text) {
+            return;
+        }
+        for (var i = 0; i < expressions.length; i++) {
+            if (expressions[i].test(text)) {
+                // Report the matching line rather than the whole text of the added element
+                var line = text.split('\\n').filter(function (part) {
+                    return expressions[i].test(part);
+                })[0] || text;
+                report('text', 'Page text: ' + line.trim().slice(0, 500));
+            }
+        }
+    };
+    if (expressions.length) {
+        new MutationObserver(function (mutations) {
+            mutations.forEach(function (mutation) {
+                if (mutation.type === 'characterData') {
+                    checkText(mutation.target.data);
+                }
+                mutation.addedNodes.forEach(function (node) {
+                    if (node.nodeType === Node.ELEMENT_NODE && (node.tagName === 'SCRIPT' || node.tagName === 'STYLE')) {
+                        return;
+                    }
+                    checkText(node.textContent);
+                });
+            });
+        }).observe(document, {childList: true, subtree: true, characterData: true});
+    }
+})(%s);
+"""
+
+# Script that returns and clears the errors collected in the page, for pages without a per-step snapshot
+drain_errors_script = "return window.__webDogErrors ? window.__webDogErrors.splice(0) : [];"
+
+# Function to inject the error hook with the given page text patterns into every document the browser loads from now on
+def install_error_hook(driver, error_patterns=default_error_patterns):
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": error_hook_script % json.dumps(list(error_patterns))})
+
+# Function to return and clear the errors collected in the page as console-log-like entries
+def drain_page_errors(driver):
+    return [{"level": error["type"], "message": error["message"]} for error in driver.execute_script(drain_errors_script)]
+
+# Define the locator strategies in order of preference: stable ids, test ids, names, accessible labels,
+# ids that look generated, and finally an indexed path anchored at the closest ancestor with a unique id
+locator_strategies = ["id", "testid", "name", "aria", "generated_id", "path"]
+
+# Define the attributes holding test ids, in order of preference
+test_id_attributes = ["data-testid", "data-test-id", "data-test", "data-qa", "data-cy"]
+
+# JavaScript functions building a verified XPath locator for an element, and the element signature the
+# snapshot script gives every candidate.
+# Every candidate locator is checked to match exactly this one element; the first unique one in order of
+# preference wins, starting with the strategy that worked last time for an element with the same signature.
+# Attribute values are quoted safely, so quotes in ids, names or labels do not break the locator.
+locator_functions_script = """
+var locatorStrategies = %s;
+var testIdAttributes = %s;
+
+function xpathLiteral(value) {
+    if (value.indexOf('"') < 0) {
+        return '"' + value + '"';
+    }
+    if (value.indexOf("'") < 0) {
+        return "'" + value + "'";
+    }
+    return 'concat("' + value.split('"').join('", \\'"\\', "') + '")';
+}
+
+function matchesOnly(xpath, el) {
+    try {
+        var result = document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        return result.snapshotLength === 1 && result.snapshotItem(0) === el;
+    } catch (e) {
+        return false;
+    }
+}
+
+function isGeneratedId(id) {
+    return /\\d{3,}|[0-9a-f]{8,}|^:r/i.test(id);
+}
+
+function testIdAttribute(el) {
+    for (var i = 0; i < testIdAttributes.length; i++) {
+        if (el.getAttribute(testIdAttributes[i])) {
+            return testIdAttributes[i];
+        }
+    }
+    return null;
+}
+
+function uniqueId(el) {
+    try {
+        return el.id && document.querySelectorAll('#' + CSS.escape(el.id)).length === 1;
+    } catch (e) {
+        return false;
+    }
+}
+
+// Indexed path such as //*[@id="form"]/div[2]/input[1], or from the root when no ancestor has a unique id
+function indexedPath(el) {
+    var steps = [];
+    for (var node = el; node && node.nodeType === Node.ELEMENT_NODE; node = node.parentElement) {
+        if (node !== el && uniqueId(node) && !isGeneratedId(node.id)) {
+            steps.unshift('//*[@id=' + xpathLiteral(node.id) + ']');
+            return steps.join('/');
+        }
+        var index = 1;
+        for (var sibling = node.previousElementSibling; sibling; sibling = sibling.previousElementSibling) {
+            if (sibling.tagName === node.tagName) {
+                index++;
+            }
+        }
+        steps.unshift(node.tagName.toLowerCase() + '[' + index + ']');
+    }
+    return '/' + steps.join('/');
+}
+
+function locatorFor(el, strategy) {
+    var tag = el.tagName.toLowerCase();
+    var id = el.getAttribute('id');
+    if (strategy === 'id') {
+        return id && !isGeneratedId(id) ? '//*[@id=' + xpathLiteral(id) + ']' : null;
+    }
+    if (strategy === 'generated_id') {
+        return id && isGeneratedId(id) ? '//*[@id=' + xpathLiteral(id) + ']' : null;
+    }
+    if (strategy === 'testid') {
+        var attribute = testIdAttribute(el);
+        return attribute ? '//*[@' + attribute + '=' + xpathLiteral(el.getAttribute(attribute)) + ']' : null;
+    }
+    if (strategy === 'name') {
+        var name = el.getAttribute('name');
+        return name ? '//' + tag + '[@name=' + xpathLiteral(name) + ']' : null;
+    }
+    if (strategy === 'aria') {
+        var label = el.getAttribute('aria-label');
+        return label ? '//' + tag + '[@aria-label=' + xpathLiteral(label) + ']' : null;
+    }
+    return indexedPath(el);
+}
+
+// Signature of an element for caching its locator strategy across pages; digits are left out so
+// generated ids and repeated rows share a signature
+function elementSignature(el) {
+    var attribute = testIdAttribute(el);
+    return [
+        el.tagName.toLowerCase(),
+        el.getAttribute('type') || '',
+        (el.getAttribute('id') || '').replace(/\\d+/g, ''),
+        el.getAttribute('name') || '',
+        attribute ? el.getAttribute(attribute) : '',
+        el.getAttribute('aria-label') || ''
+    ].join('|');
+}
+
+// Returns {locator, strategy, signature} for an element, trying the cached strategy of its signature first
+function verifiedLocator(el, cachedStrategies) {
+    var signature = elementSignature(el);
+    var cached = cachedStrategies[signature];
+    var order = cached ? [cached].concat(locatorStrategies) : locatorStrategies;
+    for (var i = 0; i < order.length; i++) {
+        var locator = locatorFor(el, order[i]);
+        if (locator && matchesOnly(locator, el)) {
+            return {locator: locator, strategy: order[i], signature: signature};
+        }
+    }
+    return {locator: indexedPath(el), strategy: 'path', signature: signature};
+}
+""" % (json.dumps(locator_strategies), json.dumps(test_id_attributes))
+
+# Script returning the verified locator of one element (arguments[0]), given the cached strategies by
+# element signature (arguments[1]). Verifying a locator searches the whole document, so it is only done
+# for the element an action is performed on rather than for every candidate.
+locate_element_script = locator_functions_script + """
+return verifiedLocator(arguments[0], arguments[1]);
+"""
+
+# Define the URL patterns blocked for each resource type by the lean profile.
+# Network.setBlockedURLs matches URLs rather than resource types, so types are blocked by their file extensions.
+resource_type_patterns = {
+    "image": ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.bmp", "*.ico", "*.svg"],
+    "font": ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"],
+    "media": ["*.mp4", "*.webm", "*.ogg", "*.mp3", "*.wav", "*.m4a"]
+}
+
+# Define the third-party trackers blocked by the lean profile
+default_blocked_url_patterns = [
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*facebook.net*",
+    "*hotjar.com*", "*segment.io*", "*newrelic.com*", "*nr-data.net*", "*clarity.ms*"
+]
+
+# Script installed in every document by the lean profile to switch off CSS animations and transitions
+disable_animations_script = """
+(function () {
+    var addStyle = function () {
+        var style = document.createElement('style');
+        style.textContent = '*, *::before, *::after { animation: none !important; transition: none !important; scroll-behavior: auto !important; caret-color: auto !important; }';
+        (document.head || document.documentElement).appendChild(style);
+    };
+    if (document.documentElement) {
+        addStyle();
+    } else {
+        document.addEventListener('DOMContentLoaded', addStyle);
+    }
+})();
+"""
+
+# Lean browser profile for exploration and replay runs: blocks resources that do not matter for finding
+# JavaScript errors, switches off animations, caps the window size and keeps a persistent disk cache
+# per browser slot, so static files are fetched once rather than once per episode or browser launch.
+class LeanProfile:
+    def __init__(self, blocked_resource_types=("image", "font", "media"), blocked_url_patterns=default_blocked_url_patterns,
+                 disable_animations=True, window_size=(1280, 800), disk_cache_dir="./chrome-cache", disk_cache_size=256 * 1024 * 1024):
+        self.blocked_resource_types = blocked_resource_types
+        self.blocked_url_patterns = blocked_url_patterns
+        self.disable_animations = disable_animations
+        self.window_size = window_size
+        self.disk_cache_dir = disk_cache_dir
+        self.disk_cache_size = disk_cache_size
+
+    def get_blocked_urls(self):
+        blocked_urls = []
+        for resource_type in self.blocked_resource_types:
+            blocked_urls.extend(resource_type_patterns[resource_type])
+        return blocked_urls + list(self.blocked_url_patterns)
+
+    # Function to add the command line switches of the profile; call before the browser is created
+    def add_arguments(self, chrome_options, cache_name):
+        chrome_options.add_argument(f"--window-size={self.window_size[0]},{self.window_size[1]}")
+        chrome_options.add_argument(f"--disk-cache-dir={os.path.abspath(os.path.join(self.disk_cache_dir, cache_name))}")
+        chrome_options.add_argument(f"--disk-cache-size={self.disk_cache_size}")
+        chrome_options.add_argument("--mute-audio")
+        chrome_options.add_argument("--no-first-run")
+        chrome_options.add_argument("--disable-background-networking")
+        chrome_options.add_argument("--disable-component-update")
+        chrome_options.add_argument("--disable-default-apps")
+        chrome_options.add_argument("--disable-sync")
+        if "image" in self.blocked_resource_types:
+            chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+
+    # Function to apply the in-browser part of the profile; call once the browser is created
+    def install(self, driver):
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": self.get_blocked_urls()})
+        if self.disable_animations:
+            driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": disable_animations_script})
+
+# Function to clear the cookies and the storage of the origins of the given pages, leaving a clean session
+def clear_browser_state(driver, urls):
+    # Session storage belongs to the tab, so it is cleared from the page that is open
+    try:
+        driver.execute_script("try { window.sessionStorage.clear(); } catch (e) {}")
+    except WebDriverException:
+        pass
+    driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+    # Clear local storage, IndexedDB and service workers of every origin
+    for page_url in set(urls):
+        parsed_url = urlparse(page_url)
+        if parsed_url.scheme in ("http", "https"):
+            origin = f"{parsed_url.scheme}://{parsed_url.netloc}"
+            driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+
+# Script returning the local and session storage of the current page
+storage_snapshot_script = """
+function copyStorage(storage) {
+    var entries = {};
+    for (var i = 0; i < storage.length; i++) {
+        var key = storage.key(i);
+        entries[key] = storage.getItem(key);
+    }
+    return entries;
+}
+try {
+    return {origin: window.location.origin, local: copyStorage(window.localStorage), session: copyStorage(window.sessionStorage)};
+} catch (e) {
+    return {origin: window.location.origin, local: {}, session: {}};
+}
+"""
+
+# Script installed for one page load to put saved storage in place before the page's own scripts run
+storage_restore_script = """
+(function (storage) {
+    if (window.location.origin !== storage.origin) {
+        return;
+    }
+    try {
+        window.localStorage.clear();
+        Object.keys(storage.local).forEach(function (key) {
+            window.localStorage.setItem(key, storage.local[key]);
+        });
+        window.sessionStorage.clear();
+        Object.keys(storage.session).forEach(function (key) {
+            window.sessionStorage.setItem(key, storage.session[key]);
+        });
+    } catch (e) {
+    }
+})(%s);
+"""
+
+# Define the cookie fields accepted by Network.setCookies
+cookie_fields = ["name", "value", "domain", "path", "secure", "httpOnly", "sameSite"]
+
+# Function to identify what a session holds by the names of its cookies and storage keys; values such as
+# timestamps or tokens are left out so that the same kind of session gets the same signature
+def get_session_signature(cookies, storage):
+    keys = [f"cookie:{cookie['domain']}:{cookie['name']}" for cookie in cookies]
+    keys += [f"local:{key}" for key in storage["local"]] + [f"session:{key}" for key in storage["session"]]
+    return hashlib.sha256(json.dumps(sorted(keys)).encode("utf-8")).hexdigest()[:16]
+
+# Checkpoints of the browser session (cookies plus local and session storage of the application) taken at
+# states where the session holds something the clean session does not, such as a login cookie or a cart
+# in local storage. Restoring one takes a few CDP commands and a single page load instead of repeating
+# the actions that led there. Each checkpoint keeps those actions so a trace starting from it can be replayed.
+class SessionStore:
+    def __init__(self, max_checkpoints=20):
+        self.max_checkpoints = max_checkpoints
+        self.checkpoints = {}
+        self.baseline_signatures = set()
+        self.restores = 0
+        self.restore_time = 0.0
+
+    def is_full(self):
+        return len(self.checkpoints) >= self.max_checkpoints
+
+    def get_session(self, driver):
+        cookies = driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+        storage = driver.execute_script(storage_snapshot_script)
+        return cookies, storage
+
+    # Function to remember the session of a clean start, which is never worth a checkpoint
+    def set_baseline(self, driver):
+        if self.max_checkpoints > 0:
+            self.baseline_signatures.add(get_session_signature(*self.get_session(driver)))
+
+    # Function to save the current session unless a session with the same signature is known; the trace
+    # records are only copied for a new one. Returns whether a checkpoint was added.
+    def capture(self, driver, url, records):
+        if self.is_full():
+            return False
+        cookies, storage = self.get_session(driver)
+        signature = get_session_signature(cookies, storage)
+        if signature in self.baseline_signatures or signature in self.checkpoints:
+            return False
+        self.checkpoints[signature] = {"url": url, "cookies": cookies, "storage": storage, "records": list(records), "restores": 0}
+        print(f"Saved session checkpoint {signature} at {url} ({len(cookies)} cookies, {len(storage['local'])} local and {len(storage['session'])} session storage entries)")
+        return True
+
+    # Function to pick the checkpoint restored least often
+    def choose(self):
+        if not self.checkpoints:
+            return None
+        return min(self.checkpoints.values(), key=lambda checkpoint: checkpoint["restores"])
+
+    # Function to restore a checkpoint into a browser whose session has been cleared
+    def restore(self, driver, checkpoint):
+        start_time = time.perf_counter()
+        cookies = []
+        for cookie in checkpoint["cookies"]:
+            cookie_params = {field: cookie[field] for field in cookie_fields if field in cookie}
+            if not cookie.get("session") and cookie.get("expires", -1) > 0:
+                cookie_params["expires"] = cookie["expires"]
+            cookies.append(cookie_params)
+        driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+
+        source = storage_restore_script % json.dumps(checkpoint["storage"])
+        identifier = driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": source})["identifier"]
+        try:
+            driver.get(checkpoint["url"])
+        finally:
+            driver.execute_cdp_cmd("Page.removeScriptToEvaluateOnNewDocument", {"identifier": identifier})
+        checkpoint["restores"] += 1
+        self.restores += 1
+        self.restore_time += time.perf_counter() - start_time
+
+    def stats(self):
+        return {
+            "checkpoints": len(self.checkpoints),
+            "restores": self.restores,
+            "average_restore_time": self.restore_time / self.restores if self.restores else 0.0
+        }
+
+# Function to measure the memory (resident set size, in bytes) of a browser and its chromedriver
+def get_browser_rss(driver):
+    try:
+        process = psutil.Process(driver.service.process.pid)
+        return sum(child.memory_info().rss for child in [process] + process.children(recursive=True))
+    except (AttributeError, psutil.Error):
+        return 0
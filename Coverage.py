@@ -0,0 +1,330 @@
+# State coverage tracking for exploration, shared by the exploration workers
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import sqlite3
+import time
+from collections import OrderedDict, deque
+from urllib.parse import urlparse
+from xml.etree import ElementTree
+
+# Function to reduce a URL to its route, ignoring ids so "/orders/17" and "/orders/18" match
+def get_route(url):
+    parsed_url = urlparse(url)
+    route = parsed_url.path
+    # Single page applications keep their route in the fragment
+    if parsed_url.fragment.startswith("/"):
+        route += "#" + parsed_url.fragment.split("?")[0]
+    segments = [":id" if re.fullmatch(r"\d+|[0-9a-fA-F-]{16,}", segment) else segment.lower() for segment in route.split("/")]
+    return "/".join(segments)
+
+# Function to identify the state of a page by its route and the structure of its usable elements.
+# Element values and text are left out so that typing into a field does not create a new state.
+def get_state_id(snapshot):
+    structure = []
+    for action_name, candidates in snapshot["elements"].items():
+        for candidate in candidates:
+            if candidate["visible"] and candidate["enabled"]:
+                identifier = re.sub(r"\d+", "", candidate["id"] or candidate["name"])
+                structure.append(f"{action_name}:{candidate['tag']}:{identifier}")
+    # Repeated elements such as table rows only count once so paging through data stays one state
+    state = {"route": get_route(snapshot["url"]), "structure": sorted(set(structure))}
+    return hashlib.sha256(json.dumps(state).encode("utf-8")).hexdigest()[:16]
+
+# Bounded history of the (state id, action type, element signature) keys an agent has tried.
+# Lookups and additions are O(1); once the window is full the least recently tried key is forgotten.
+class ActionHistory:
+    def __init__(self, window):
+        self.window = window
+        self.keys = OrderedDict()
+
+    def add(self, key):
+        self.keys.pop(key, None)
+        self.keys[key] = True
+        if len(self.keys) > self.window:
+            self.keys.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def clear(self):
+        self.keys.clear()
+
+# Decides when an episode has stopped paying off: after stall_steps steps without reaching a state not
+# seen earlier in the episode, such as a logged-out page or a modal trapping the agent, or once the
+# episode has run for time_budget seconds. It also counts the states no worker had seen before, which
+# per minute of exploration is the main measure of how well the time is spent.
+class EpisodeScheduler:
+    def __init__(self, stall_steps=300, time_budget=600.0):
+        self.stall_steps = stall_steps
+        self.time_budget = time_budget
+        self.start_time = time.perf_counter()
+        self.episode_start = self.start_time
+        self.episode_states = set()
+        self.steps_since_new_state = 0
+        self.stop_reason = None
+        self.episodes = 0
+        self.stalled_episodes = 0
+        self.timed_out_episodes = 0
+        self.new_states = 0
+
+    def start_episode(self, state_id):
+        self.episode_start = time.perf_counter()
+        self.episode_states = {state_id} if state_id is not None else set()
+        self.steps_since_new_state = 0
+        self.stop_reason = None
+        self.episodes += 1
+
+    # Function to count a step that reached state_id and discovered new_states states, returning why
+    # the episode should end or None
+    def record_step(self, state_id, new_states):
+        self.new_states += new_states
+        if state_id is not None and state_id not in self.episode_states:
+            self.episode_states.add(state_id)
+            self.steps_since_new_state = 0
+        else:
+            self.steps_since_new_state += 1
+
+        if self.stall_steps and self.steps_since_new_state >= self.stall_steps:
+            self.stop_reason = f"no new state for {self.steps_since_new_state} steps"
+            self.stalled_episodes += 1
+        elif self.time_budget and time.perf_counter() - self.episode_start >= self.time_budget:
+            self.stop_reason = f"episode time budget of {self.time_budget:.0f}s used up"
+            self.timed_out_episodes += 1
+        return self.stop_reason
+
+    def states_per_minute(self):
+        elapsed = time.perf_counter() - self.start_time
+        return self.new_states / elapsed * 60 if elapsed > 0 else 0.0
+
+    def stats(self):
+        return {
+            "episodes": self.episodes,
+            "stalled_episodes": self.stalled_episodes,
+            "timed_out_episodes": self.timed_out_episodes,
+            "new_states": self.new_states,
+            "states_per_minute": round(self.states_per_minute(), 2)
+        }
+
+# Persistent index of visited states and (state, action, element) transitions stored in SQLite.
+# It is shared by all workers and kept across runs, so a state counts as new only the first time
+# any worker ever reaches it. Visit counts are buffered in memory and written by flush().
+# Together the states and transitions form a navigation graph that is used to jump straight to
+# rarely visited states and that can be exported as JSON or GraphML.
+class CoverageIndex:
+    def __init__(self, path, new_state_reward=1.0, new_transition_reward=0.1):
+        self.path = path
+        self.new_state_reward = new_state_reward
+        self.new_transition_reward = new_transition_reward
+        self.new_states = 0
+        self.new_transitions = 0
+        self.state_visits = {}
+        self.transition_visits = {}
+
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS states ("
+            "state_id TEXT PRIMARY KEY, route TEXT NOT NULL, url TEXT NOT NULL, first_seen REAL NOT NULL, visits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS transitions ("
+            "state_id TEXT NOT NULL, action TEXT NOT NULL, element TEXT NOT NULL, next_state_id TEXT NOT NULL, "
+            "first_seen REAL NOT NULL, visits INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (state_id, action, element, next_state_id))"
+        )
+        # Whether a state can be reached by loading its URL directly: NULL until tried, then 1 or 0
+        self.add_column_if_missing("states", "addressable", "INTEGER")
+        # The value typed, selected or scrolled by a transition, so the transition can be repeated
+        self.add_column_if_missing("transitions", "value", "TEXT NOT NULL DEFAULT ''")
+        self.connection.commit()
+
+        self.known_states = {row[0] for row in self.connection.execute("SELECT state_id FROM states")}
+        self.known_transitions = {tuple(row) for row in self.connection.execute("SELECT state_id, action, element, next_state_id FROM transitions")}
+
+    # Function to add a column to an index created by an earlier version
+    def add_column_if_missing(self, table, column, definition):
+        columns = [row[1] for row in self.connection.execute(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            self.connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    # Function to record a visit to a state, returning True the first time any worker reaches it
+    def record_state(self, state_id, url):
+        self.state_visits[state_id] = self.state_visits.get(state_id, 0) + 1
+        if state_id in self.known_states:
+            return False
+
+        self.known_states.add(state_id)
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO states (state_id, route, url, first_seen) VALUES (?, ?, ?, ?)",
+                (state_id, get_route(url), url, time.time())
+            )
+        # Another worker may have inserted the state since this index was loaded
+        is_new = cursor.rowcount == 1
+        if is_new:
+            self.new_states += 1
+        return is_new
+
+    # Function to record a transition, returning True the first time any worker makes it
+    def record_transition(self, state_id, action_name, element, value, next_state_id):
+        transition = (state_id, action_name, element, next_state_id)
+        self.transition_visits[transition] = self.transition_visits.get(transition, 0) + 1
+        if transition in self.known_transitions:
+            return False
+
+        self.known_transitions.add(transition)
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO transitions (state_id, action, element, next_state_id, first_seen, value) VALUES (?, ?, ?, ?, ?, ?)",
+                transition + (time.time(), value)
+            )
+        is_new = cursor.rowcount == 1
+        if is_new:
+            self.new_transitions += 1
+        return is_new
+
+    # Function to record a step and return its novelty reward
+    def get_novelty_reward(self, state_id, action_name, element, value, next_state_id, next_url):
+        if next_state_id is None:
+            return 0.0
+
+        reward = 0.0
+        if self.record_state(next_state_id, next_url):
+            print(f"New state discovered: {next_url}")
+            reward += self.new_state_reward
+        if state_id is not None and self.record_transition(state_id, action_name, element, value, next_state_id):
+            reward += self.new_transition_reward
+        return reward
+
+    # Function to remember whether loading the URL of a state reproduces the state
+    def set_addressable(self, state_id, addressable):
+        with self.connection:
+            self.connection.execute("UPDATE states SET addressable = ? WHERE state_id = ?", (1 if addressable else 0, state_id))
+
+    # Function to list the least explored states of a domain as (state id, url, addressable) tuples.
+    # States with the fewest outgoing transitions come first, then the least visited ones, and
+    # the order within the first few is shuffled so parallel workers spread over the frontier.
+    def get_frontier_states(self, exclude_state_id, domain, limit=10):
+        self.flush()
+        rows = self.connection.execute(
+            "SELECT s.state_id, s.url, s.addressable FROM states s "
+            "LEFT JOIN transitions t ON t.state_id = s.state_id "
+            "WHERE s.state_id != ? "
+            "GROUP BY s.state_id ORDER BY COUNT(t.state_id) ASC, s.visits ASC",
+            (exclude_state_id,)
+        )
+        frontier = [row for row in rows if urlparse(row[1]).netloc == domain][:limit]
+        random.shuffle(frontier)
+        return frontier
+
+    # Function to find the shortest recorded list of (action, element, value) steps between two states
+    def get_shortest_path(self, start_state_id, target_state_id, max_length):
+        edges = {}
+        for state_id, action_name, element, value, next_state_id in self.connection.execute(
+                "SELECT state_id, action, element, value, next_state_id FROM transitions WHERE state_id != next_state_id"):
+            edges.setdefault(state_id, []).append((next_state_id, (action_name, element, value)))
+
+        # Breadth-first search over the recorded transitions
+        previous = {start_state_id: None}
+        queue = deque([(start_state_id, 0)])
+        while queue:
+            state_id, length = queue.popleft()
+            if state_id == target_state_id:
+                path = []
+                while previous[state_id] is not None:
+                    state_id, step = previous[state_id]
+                    path.append(step)
+                return list(reversed(path))
+            if length >= max_length:
+                continue
+            for next_state_id, step in edges.get(state_id, []):
+                if next_state_id not in previous:
+                    previous[next_state_id] = (state_id, step)
+                    queue.append((next_state_id, length + 1))
+        return None
+
+    # Function to return the navigation graph as plain nodes and edges
+    def get_graph(self):
+        self.flush()
+        nodes = [
+            {"id": state_id, "route": route, "url": url, "visits": visits, "addressable": addressable}
+            for state_id, route, url, visits, addressable in self.connection.execute("SELECT state_id, route, url, visits, addressable FROM states")
+        ]
+        edges = [
+            {"source": state_id, "target": next_state_id, "action": action_name, "element": element, "value": value, "visits": visits}
+            for state_id, action_name, element, value, next_state_id, visits in self.connection.execute(
+                "SELECT state_id, action, element, value, next_state_id, visits FROM transitions")
+        ]
+        return {"nodes": nodes, "edges": edges}
+
+    # Function to export the navigation graph as GraphML when the path ends in .graphml, otherwise as JSON
+    def export_graph(self, path):
+        graph = self.get_graph()
+        if not path.endswith(".graphml"):
+            with open(path, "w") as f:
+                json.dump(graph, f, indent=2)
+            return
+
+        root = ElementTree.Element("graphml", xmlns="http://graphml.graphdrawing.org/xmlns")
+        for key_id, owner, name, key_type in [
+                ("route", "node", "route", "string"), ("url", "node", "url", "string"),
+                ("visits", "node", "visits", "int"), ("addressable", "node", "addressable", "string"),
+                ("action", "edge", "action", "string"), ("element", "edge", "element", "string"),
+                ("value", "edge", "value", "string"), ("edge_visits", "edge", "visits", "int")]:
+            ElementTree.SubElement(root, "key", {"id": key_id, "for": owner, "attr.name": name, "attr.type": key_type})
+
+        graph_element = ElementTree.SubElement(root, "graph", id="coverage", edgedefault="directed")
+        for node in graph["nodes"]:
+            node_element = ElementTree.SubElement(graph_element, "node", id=node["id"])
+            for key in ("route", "url", "visits", "addressable"):
+                ElementTree.SubElement(node_element, "data", key=key).text = "" if node[key] is None else str(node[key])
+        for edge in graph["edges"]:
+            edge_element = ElementTree.SubElement(graph_element, "edge", source=edge["source"], target=edge["target"])
+            for key in ("action", "element", "value"):
+                ElementTree.SubElement(edge_element, "data", key=key).text = edge[key]
+            ElementTree.SubElement(edge_element, "data", key="edge_visits").text = str(edge["visits"])
+        ElementTree.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
+
+    # Function to write the buffered visit counts
+    def flush(self):
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE states SET visits = visits + ? WHERE state_id = ?",
+                [(visits, state_id) for state_id, visits in self.state_visits.items()]
+            )
+            self.connection.executemany(
+                "UPDATE transitions SET visits = visits + ? WHERE state_id = ? AND action = ? AND element = ? AND next_state_id = ?",
+                [(visits,) + transition for transition, visits in self.transition_visits.items()]
+            )
+        self.state_visits = {}
+        self.transition_visits = {}
+
+    def stats(self):
+        return {
+            "known_states": len(self.known_states),
+            "known_transitions": len(self.known_transitions),
+            "new_states": self.new_states,
+            "new_transitions": self.new_transitions
+        }
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the navigation graph recorded during exploration")
+    parser.add_argument("output", help="Output file; .graphml for GraphML, anything else for JSON")
+    parser.add_argument("--coverage-file", default="coverage.sqlite", help="Coverage index to export")
+    args = parser.parse_args()
+
+    coverage = CoverageIndex(args.coverage_file)
+    coverage.export_graph(args.output)
+    print(f"Exported {len(coverage.known_states)} states and {len(coverage.known_transitions)} transitions to {args.output}")
+    coverage.close()
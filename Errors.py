@@ -0,0 +1,133 @@
+# Error signatures, so that the same error can be recognized across steps, replays and runs
+
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import time
+
+# Function to reduce an error message to its signature by removing the parts that change between
+# occurrences of the same error: URLs, line and column numbers, generated ids and long numbers.
+# Line and column numbers are only removed right after a URL or at the end of the message, so times
+# such as "10:30" in the message text still tell errors apart.
+def normalize_error_message(message):
+    message = re.sub(r"\b[a-z][a-z0-9+.-]*://\S+", "<url>", message, flags=re.IGNORECASE)
+    message = re.sub(r"<url> \d+:\d+(?!\S)", "<url>", message)
+    message = re.sub(r"(:\d+){1,2}(\)?)$", r"\2", message.strip())
+    message = re.sub(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", "<id>", message, flags=re.IGNORECASE)
+    message = re.sub(r"\b(?=[0-9a-f]*\d)[0-9a-f]{12,}\b", "<id>", message, flags=re.IGNORECASE)
+    message = re.sub(r"\b\d{4,}\b", "<n>", message)
+    return " ".join(message.split())
+
+# Function to read the error messages of an Error_*.log file, from the browser log and from the page
+def read_error_log(path):
+    messages = []
+    with open(path, "r") as f:
+        for line in f:
+            match = re.match(r"\[(SEVERE|ERROR|error|rejection|console|text)\] - (.*)", line.strip())
+            if match:
+                messages.append(match.group(2))
+    return messages
+
+# Function to check whether any console message has the given error signature
+def has_error_signature(messages, signature):
+    return any(signature in normalize_error_message(message) for message in messages)
+
+# Persistent index of error signatures stored in SQLite, shared by all workers and kept across runs.
+# It counts how often each signature occurred and remembers the first saved log and screenshot and
+# the shortest trace that ran into it, so only the first few occurrences of an error need to be saved.
+class ErrorIndex:
+    def __init__(self, path, max_saved_occurrences=3):
+        self.path = path
+        self.max_saved_occurrences = max_saved_occurrences
+        self.new_signatures = 0
+        self.suppressed = 0
+
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS errors ("
+            "signature_id TEXT PRIMARY KEY, signature TEXT NOT NULL, message TEXT NOT NULL, occurrences INTEGER NOT NULL DEFAULT 0, "
+            "first_seen REAL NOT NULL, last_seen REAL NOT NULL, log_file TEXT, screenshot_file TEXT, "
+            "shortest_trace TEXT, shortest_trace_length INTEGER)"
+        )
+        self.connection.commit()
+
+    # Function to record an occurrence of an error message.
+    # Returns the signature id, the number of occurrences so far and whether the trace is now the shortest one reproducing it.
+    def record(self, message, trace_path=None, trace_length=None):
+        signature = normalize_error_message(message)
+        signature_id = hashlib.sha256(signature.encode("utf-8")).hexdigest()[:16]
+        now = time.time()
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO errors (signature_id, signature, message, first_seen, last_seen) VALUES (?, ?, ?, ?, ?)",
+                (signature_id, signature, message, now, now)
+            )
+            if cursor.rowcount == 1:
+                self.new_signatures += 1
+            self.connection.execute("UPDATE errors SET occurrences = occurrences + 1, last_seen = ? WHERE signature_id = ?", (now, signature_id))
+            is_shortest = False
+            if trace_path is not None:
+                cursor = self.connection.execute(
+                    "UPDATE errors SET shortest_trace = ?, shortest_trace_length = ? "
+                    "WHERE signature_id = ? AND (shortest_trace_length IS NULL OR shortest_trace_length > ?)",
+                    (trace_path, trace_length, signature_id, trace_length)
+                )
+                is_shortest = cursor.rowcount == 1
+            occurrences = self.connection.execute("SELECT occurrences FROM errors WHERE signature_id = ?", (signature_id,)).fetchone()[0]
+        return signature_id, occurrences, is_shortest
+
+    # Function to decide whether an occurrence is among the first ones whose log and screenshot are kept
+    def should_save(self, occurrences):
+        if occurrences <= self.max_saved_occurrences:
+            return True
+        self.suppressed += 1
+        return False
+
+    # Function to remember the first saved log and screenshot of a signature
+    def set_files(self, signature_id, log_file, screenshot_file):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE errors SET log_file = COALESCE(log_file, ?), screenshot_file = COALESCE(screenshot_file, ?) WHERE signature_id = ?",
+                (log_file, screenshot_file, signature_id)
+            )
+
+    # Function to list the unique errors, the most frequent first
+    def get_report(self):
+        columns = ["signature_id", "signature", "message", "occurrences", "first_seen", "last_seen",
+                   "log_file", "screenshot_file", "shortest_trace", "shortest_trace_length"]
+        rows = self.connection.execute(f"SELECT {', '.join(columns)} FROM errors ORDER BY occurrences DESC, first_seen ASC")
+        return [dict(zip(columns, row)) for row in rows]
+
+    # Function to write the report of unique errors as JSON
+    def export_report(self, path):
+        report = self.get_report()
+        with open(path, "w") as f:
+            json.dump({"unique_errors": len(report), "occurrences": sum(error["occurrences"] for error in report), "errors": report}, f, indent=2)
+        return report
+
+    def stats(self):
+        return {
+            "known_signatures": self.connection.execute("SELECT COUNT(*) FROM errors").fetchone()[0],
+            "new_signatures": self.new_signatures,
+            "suppressed_saves": self.suppressed
+        }
+
+    def close(self):
+        self.connection.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the unique errors found during exploration")
+    parser.add_argument("--error-index", default="error_index.sqlite", help="Error signature index to report")
+    parser.add_argument("--output", default=None, help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    error_index = ErrorIndex(args.error_index)
+    report = error_index.export_report(args.output) if args.output else error_index.get_report()
+    for error in report:
+        print(f"{error['occurrences']:>6}  {error['signature']}")
+        print(f"        shortest trace: {error['shortest_trace']} ({error['shortest_trace_length']} actions)")
+    print(f"{len(report)} unique errors")
+    error_index.close()
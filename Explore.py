@@ -2,49 +2,112 @@
 
 import psutil
 import os
+import argparse
 import time
 import random
 import numpy as np
 import gym
 import sys
 import json
-import re
 import requests
-from llama_cpp import Llama
-import urllib.parse
+import threading
+import hashlib
+import uuid
+from collections import OrderedDict, deque
 from stable_baselines3 import PPO
-from stable_baselines3.common.vec_env import DummyVecEnv
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import Select
 from selenium.common.exceptions import ElementNotInteractableException  # Add this import
 from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
-
-# Define a cache for storing the last 20 action_str values
-action_str_cache = []
-
-# Define a cache for storing messages and their corresponding LLM responses
-llama_cache = {}
-
-# Load existing llama cache from JSON file if it exists
-llama_cache_file = "llama_cache.json"
-if os.path.exists(llama_cache_file):
-    with open(llama_cache_file, "r") as f:
-        llama_cache = json.load(f)
+from SampleValues import LlamaCache, SampleValueGenerator, get_field_signature
+from Coverage import ActionHistory, CoverageIndex, EpisodeScheduler, get_route, get_state_id
+from Trace import TraceWriter, export_scripts
+from Browser import LeanProfile, SessionStore, WaitPolicy, clear_browser_state, default_blocked_url_patterns, default_error_patterns, get_browser_rss, install_error_hook, locate_element_script, locator_functions_script, resource_type_patterns
+from Errors import ErrorIndex, normalize_error_message
+from Profiler import NullProfiler, ProfilingCallback, StepProfiler
+
+# Define how many (state, action, element) keys are remembered as tried in the current episode and across episodes
+episode_action_window = 200
+global_action_window = 5000
+
+# Define the scroll amounts the agent can choose from
+scroll_amounts = [200, 400, 600]
+
+# Define the persistent cache for storing messages and their corresponding LLM responses.
+# It is shared by all workers and written after every new response.
+llama_cache_file = "llama_cache.sqlite"
+# Define the maximum number of cached responses before least recently used ones are evicted
+llama_cache_max_entries = 10000
+
+# Define the persistent index of visited states and transitions, shared by all workers and runs
+coverage_file = "coverage.sqlite"
+
+# Define the error signature index and how many occurrences of each error get a log and screenshot
+error_index_file = "error_index.sqlite"
+max_saved_error_occurrences = 3
+
+# Errors are collected inside the page and read with every snapshot; the browser log, which only adds
+# errors the page cannot see such as failed resource loads, is read every few steps
+browser_log_interval = 10
+
+# Define how many element signatures remember the locator strategy that worked for them
+locator_cache_size = 500
+
+# Define where TensorBoard logs of training and of the step profiler are written
+tensorboard_log_dir = "./ppo_web_app_tensorboard/"
+# Define the rewards for reaching a state or making a transition no worker has seen before
+new_state_reward = 1.0
+new_transition_reward = 0.1
+# Define the share of episodes that start at a frontier state instead of the landing page
+teleport_probability = 0.5
+# Define the longest recorded action path replayed to reach a frontier state
+max_teleport_path_length = 50
+# Define the share of episodes that start from a saved session checkpoint when there is one
+session_restore_probability = 0.5
 
 file_url = "https://huggingface.co/TheBloke/Mistral-7B-Instruct-v0.2-GGUF/resolve/main/mistral-7b-instruct-v0.2.Q2_K.gguf"
 file_name = "mistral-7b-instruct-v0.2.Q2_K.gguf"
 
-# Check if the file already exists
-if not os.path.exists(file_name):
-    # If not, download the file
-    response = requests.get(file_url)
-    with open(file_name, "wb") as file:
-        file.write(response.content)
+# Size of the chunks streamed to disk while downloading the model
+download_chunk_size = 8 * 1024 * 1024
+
+# Function to download the model file if it does not exist yet.
+# The file is streamed to a ".part" file in chunks, so it never has to fit in memory, and an
+# interrupted download resumes from where it stopped on the next run.
+def download_model():
+    # Check if the file already exists
+    if os.path.exists(file_name):
+        print(f"{file_name} already exists in the current directory.")
+        return
+
+    partial_file_name = file_name + ".part"
+    downloaded_size = os.path.getsize(partial_file_name) if os.path.exists(partial_file_name) else 0
+    headers = {"Range": f"bytes={downloaded_size}-"} if downloaded_size else {}
+
+    with requests.get(file_url, headers=headers, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        if downloaded_size and response.status_code == 206:
+            print(f"Resuming download of {file_name} at {downloaded_size} bytes.")
+            mode = "ab"
+        else:
+            # The server ignored the range request, so start over
+            downloaded_size = 0
+            mode = "wb"
+
+        total_size = downloaded_size + int(response.headers.get("Content-Length", 0))
+        with open(partial_file_name, mode) as file:
+            for chunk in response.iter_content(chunk_size=download_chunk_size):
+                file.write(chunk)
+                downloaded_size += len(chunk)
+                if total_size:
+                    print(f"Downloading {file_name}: {downloaded_size * 100 // total_size}%", end="\r")
+
+    os.replace(partial_file_name, file_name)
     print(f"{file_name} downloaded successfully.")
-else:
-    print(f"{file_name} already exists in the current directory.")
 
 model_name = file_name
 
@@ -74,7 +137,19 @@ llama_params = {
     "tfs": 0.68
 }
 
-llama = Llama(model_name, **llama_params)
+# The model is loaded lazily, once per process, on the first LLM cache miss
+llama = None
+llama_lock = threading.Lock()
+
+# Function to load the model into this process if it is not loaded yet
+def load_llama():
+    global llama
+    with llama_lock:
+        if llama is None:
+            from llama_cpp import Llama
+            print(f"Loading {model_name}")
+            llama = Llama(model_name, **llama_params)
+    return llama
 
 # Function to terminate chromedriver.exe processes
 def terminate_chromedriver_processes():
@@ -86,12 +161,6 @@ def terminate_chromedriver_processes():
             except Exception as e:
                 print(f"Failed to terminate process (PID: {process.info['pid']}), error: {e}")
 
-# Terminate existing chromedriver.exe processes before starting
-terminate_chromedriver_processes()
-
-# Accept the web application URL as user input
-web_app_url = input("Enter the web application URL: ")
-
 # Define the available actions, including "select_option" and "enter_date"
 actions = ["click", "input_text", "scroll", "select_option", "enter_date", "select_radio"]
 num_actions = len(actions)
@@ -102,17 +171,20 @@ max_episodes = 100
 # Define the maximum number of steps per episode
 max_steps = 10000
 
-# Create a subfolder for generated scripts
+# Define the subfolder for generated scripts
 subfolder = "./generated-scripts"
-if not os.path.exists(subfolder):
-    os.makedirs(subfolder)
 
 # Define the path to the /models directory
 model_dir = "./models"
 
-# Ensure the /models directory exists
-if not os.path.exists(model_dir):
-    os.makedirs(model_dir)
+# Define how many timesteps of training pass between saving the model and the state of the workers
+checkpoint_interval = 10000
+
+# Define the base remote debugging port; each worker uses the base port plus its index
+remote_debugging_port = 9155
+
+# Define the folder holding one isolated Chrome profile per worker
+profile_dir = "./chrome-profiles"
 
 # Function to get the domain from a URL
 def get_domain(url):
@@ -120,485 +192,1064 @@ def get_domain(url):
     parsed_url = urlparse(url)
     return parsed_url.netloc
 
-# New function to generate a more robust XPATH with unique attributes or identifiers
-def get_robust_xpath(element):
-    """
-    Get a more robust XPath of a WebElement using unique attributes or identifiers.
-    """
-    element_id = element.get_attribute("id")
-    if element_id:
-        return f'//*[@id="{element_id}"]'
-
-    element_name = element.get_attribute("name")
-    if element_name:
-        return f'//*[@name="{element_name}"]'
-
-    element_value = element.get_attribute("value")
-    if element_value:
-        return f'//*[contains(@value, "{element_value}")]'
-
-    element_text = element.text
-    if element_text:
-        return f'//*[contains(text(), "{element_text}")]'
-
-    element_xpath = element.get_attribute("xpath")
-    if not element_xpath:
-        element_xpath = ""
+# CSS selectors used to discover candidate elements for each action type
+action_selectors = {
+    "click": 'a, button, input[type="submit"]',
+    "input_text": 'input[type="text"], input[type="password"], input[type="email"]',
+    "scroll": "",
+    "select_option": 'select',
+    "enter_date": 'input[type="date"]',
+    "select_radio": 'input[type="radio"]'
+}
+
+# Script executed in the page to collect every candidate element for every action type in a
+# single WebDriver round-trip. Each candidate carries its visibility and enabled state, the element
+# signature (for usable candidates), the semantic attributes of input fields, and the WebElement
+# reference itself for interaction. Locators are only built for the element an action is performed on.
+snapshot_script = locator_functions_script + """
+var selectors = arguments[0];
+
+function isVisible(el) {
+    var style = window.getComputedStyle(el);
+    if (style.display === 'none' || style.visibility === 'hidden' || style.visibility === 'collapse') {
+        return false;
+    }
+    if (parseFloat(style.opacity) === 0) {
+        return false;
+    }
+    var rect = el.getBoundingClientRect();
+    return el.getClientRects().length > 0 && rect.width > 0 && rect.height > 0;
+}
+
+function elementValue(el) {
+    if (el.value !== undefined && el.value !== null) {
+        return String(el.value);
+    }
+    return el.getAttribute('value') || '';
+}
+
+// Attributes describing what kind of value an input field expects
+function fieldAttributes(el) {
+    var label = '';
+    if (el.labels && el.labels.length > 0) {
+        label = el.labels[0].innerText;
+    } else {
+        label = el.getAttribute('aria-label') || '';
+    }
+    return {
+        type: el.getAttribute('type') || 'text',
+        name: el.getAttribute('name') || '',
+        placeholder: el.getAttribute('placeholder') || '',
+        label: label || '',
+        pattern: el.getAttribute('pattern') || '',
+        min: el.getAttribute('min') || '',
+        max: el.getAttribute('max') || '',
+        maxlength: el.getAttribute('maxlength') || '',
+        autocomplete: el.getAttribute('autocomplete') || ''
+    };
+}
+
+// Names of the cookies and storage keys visible to the page, to notice when the session changes
+function sessionKeys() {
+    var keys = [];
+    try {
+        document.cookie.split(';').forEach(function (cookie) {
+            var name = cookie.split('=')[0].trim();
+            if (name) {
+                keys.push('cookie:' + name);
+            }
+        });
+        for (var i = 0; i < window.localStorage.length; i++) {
+            keys.push('local:' + window.localStorage.key(i));
+        }
+        for (var j = 0; j < window.sessionStorage.length; j++) {
+            keys.push('session:' + window.sessionStorage.key(j));
+        }
+    } catch (e) {
+    }
+    return keys.sort();
+}
+
+var scrollRange = document.documentElement.scrollHeight - window.innerHeight;
+var snapshot = {
+    url: window.location.href,
+    scroll_ratio: scrollRange > 0 ? Math.min(window.scrollY / scrollRange, 1) : 0,
+    elements: {},
+    session_keys: sessionKeys(),
+    // Drain the errors collected by the error hook since the last snapshot
+    errors: window.__webDogErrors ? window.__webDogErrors.splice(0) : []
+};
+Object.keys(selectors).forEach(function (action) {
+    var candidates = [];
+    if (selectors[action]) {
+        document.querySelectorAll(selectors[action]).forEach(function (el) {
+            var value = elementValue(el);
+            var text = (el.innerText || '').trim();
+            var candidate = {
+                element: el,
+                tag: el.tagName.toLowerCase(),
+                id: el.getAttribute('id') || '',
+                name: el.getAttribute('name') || '',
+                value: value,
+                text: text,
+                visible: isVisible(el),
+                enabled: !el.matches(':disabled'),
+                signature: ''
+            };
+            if (candidate.visible && candidate.enabled) {
+                candidate.signature = elementSignature(el);
+            }
+            if (action === 'input_text' || action === 'enter_date') {
+                candidate.field = fieldAttributes(el);
+            }
+            if (action === 'select_option') {
+                candidate.options = Array.prototype.map.call(el.options, function (option) {
+                    return option.value;
+                });
+            }
+            candidates.push(candidate);
+        });
+    }
+    snapshot.elements[action] = candidates;
+});
+return snapshot;
+"""
+
+# Function to keep only the candidates that can currently be interacted with
+def get_valid_candidates(snapshot, action_name):
+    return [candidate for candidate in snapshot["elements"].get(action_name, []) if candidate["visible"] and candidate["enabled"]]
+
+# Define the layout of the observation vector given to the PPO policy
+# Element counts above this value are treated as "many"
+max_element_count = 100
+# Number of buckets the normalized route of the current URL is hashed into
+route_buckets = 16
+# Number of most recent actions included in the observation
+action_history_length = 5
+# Actions that act on page elements and therefore have element counts
+element_actions = [action_name for action_name in actions if action_selectors[action_name]]
+# Total and usable count per element action, route buckets, form fill ratio, alert present,
+# URL changed, scroll position, episode progress and the one-hot recent action history
+observation_size = 2 * len(element_actions) + route_buckets + 5 + action_history_length * num_actions
+
+# Function to map a route to a bucket that is the same in every worker process
+def get_route_bucket(url):
+    return int(hashlib.md5(get_route(url).encode("utf-8")).hexdigest(), 16) % route_buckets
+
+# Function to encode a page snapshot and the recent history as a fixed-size float32 vector
+def encode_observation(snapshot, action_history, alert_present, url_changed, current_step):
+    observation = np.zeros(observation_size, dtype=np.float32)
+    offset = 0
+
+    if snapshot is not None:
+        for action_name in element_actions:
+            candidates = snapshot["elements"].get(action_name, [])
+            valid_count = sum(1 for candidate in candidates if candidate["visible"] and candidate["enabled"])
+            observation[offset] = min(np.log1p(len(candidates)) / np.log1p(max_element_count), 1)
+            observation[offset + 1] = min(np.log1p(valid_count) / np.log1p(max_element_count), 1)
+            offset += 2
+
+        observation[offset + get_route_bucket(snapshot["url"])] = 1
+        offset += route_buckets
+
+        # Share of usable text and date fields that already hold a value
+        fields = get_valid_candidates(snapshot, "input_text") + get_valid_candidates(snapshot, "enter_date")
+        observation[offset] = sum(1 for field in fields if field["value"]) / len(fields) if fields else 0
+        observation[offset + 3] = snapshot["scroll_ratio"]
     else:
-        element_xpath += "/"
-    element_xpath += f"{element.tag_name}"
-    return element_xpath
-
-# Initialize the Selenium WebDriver
-chrome_driver_path = os.path.join(os.path.dirname(__file__), "chromedriver.exe")
-chrome_service = ChromeService(executable_path=chrome_driver_path)
-chrome_service.start()
-capabilities = DesiredCapabilities.CHROME
-capabilities['goog:loggingPrefs'] = {'browser': 'ALL'}
-chrome_options = webdriver.ChromeOptions()
-chrome_options.add_argument("--headless")  # Run headless for faster testing
-chrome_options.add_argument("--disable-infobars")
-chrome_options.add_argument("--disable-extensions")
-chrome_options.add_argument("--disable-gpu")
-chrome_options.add_argument("--disable-dev-shm-usage")
-chrome_options.add_argument("--no-sandbox")
-chrome_options.add_argument("--remote-debugging-port=9155")
-chrome_options.add_argument("--start-maximized")
-chrome_options.add_argument("--disable-notifications")
-chrome_options.add_argument("--ignore-certificate-errors")
-chrome_options.add_argument("--disable-popup-blocking")
-chrome_options.add_argument("--disable-logging")  # Disable logging to console
-chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-
-driver = webdriver.Chrome(options=chrome_options, desired_capabilities=capabilities)
+        offset += 2 * len(element_actions) + route_buckets
+
+    observation[offset + 1] = 1 if alert_present else 0
+    observation[offset + 2] = 1 if url_changed else 0
+    observation[offset + 4] = min(current_step / max_steps, 1)
+    offset += 5
+
+    # Most recent action first
+    for index, action in enumerate(reversed(action_history)):
+        observation[offset + index * num_actions + int(action)] = 1
+
+    return observation
+
+# Function to initialize a Selenium WebDriver with its own debugging port and profile. By default these
+# belong to the worker; browsers that must not share them with a worker, such as the benchmark's, pass their own.
+def create_driver(worker_index=0, lean_profile=None, headless=True, user_data_dir=None, debugging_port=None):
+    chrome_driver_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chromedriver.exe")
+    chrome_service = ChromeService(executable_path=chrome_driver_path)
+    capabilities = DesiredCapabilities.CHROME.copy()
+    capabilities['goog:loggingPrefs'] = {'browser': 'ALL'}
+    # Leave unexpected alerts open for the agent instead of letting the next command dismiss them
+    capabilities['unhandledPromptBehavior'] = 'ignore'
+    if user_data_dir is None:
+        user_data_dir = os.path.join(profile_dir, f"worker_{worker_index}")
+    if debugging_port is None:
+        debugging_port = remote_debugging_port + worker_index
+    chrome_options = webdriver.ChromeOptions()
+    if headless:
+        chrome_options.add_argument("--headless")  # Run headless for faster testing
+    chrome_options.add_argument("--disable-infobars")
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument(f"--remote-debugging-port={debugging_port}")
+    chrome_options.add_argument(f"--user-data-dir={os.path.abspath(user_data_dir)}")
+    if lean_profile is not None:
+        lean_profile.add_arguments(chrome_options, f"worker_{worker_index}")
+    else:
+        chrome_options.add_argument("--start-maximized")
+    chrome_options.add_argument("--disable-notifications")
+    chrome_options.add_argument("--ignore-certificate-errors")
+    chrome_options.add_argument("--disable-popup-blocking")
+    chrome_options.add_argument("--disable-logging")  # Disable logging to console
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+
+    driver = webdriver.Chrome(service=chrome_service, options=chrome_options, desired_capabilities=capabilities)
+    if lean_profile is not None:
+        lean_profile.install(driver)
+    return driver
 
 # Custom Gym environment for the web application
 class WebAppEnv(gym.Env):
-    def __init__(self, driver, llama_cache):
+    def __init__(self, driver, value_generator, coverage, error_index, web_app_url, output_dir, worker_index=0, wait_policy=None, profiler=None, scheduler=None, session_store=None):
         super(WebAppEnv, self).__init__()
         self.driver = driver
-        self.llama_cache = llama_cache
+        self.wait_policy = wait_policy if wait_policy is not None else WaitPolicy()
+        self.profiler = profiler if profiler is not None else NullProfiler()
+        self.scheduler = scheduler if scheduler is not None else EpisodeScheduler()
+        self.session_store = session_store if session_store is not None else SessionStore()
+        self.value_generator = value_generator
+        self.coverage = coverage
+        self.error_index = error_index
+        self.steps_since_log_poll = 0
+        self.locator_strategies = OrderedDict()
+        self.steps_taken = 0
+        self.start_time = time.perf_counter()
+        self.episode_actions = ActionHistory(episode_action_window)
+        self.global_actions = ActionHistory(global_action_window)
+        self.web_app_url = web_app_url
+        self.output_dir = output_dir
+        self.worker_index = worker_index
         self.action_space = gym.spaces.Discrete(num_actions)
-        self.observation_space = gym.spaces.Box(low=0, high=1, shape=(max_steps,))  # Adjust the observation space accordingly
-        
-        self.state = 0  # Initial state
-        self.current_step = 0
-        self.actions_sequence = []
-        self.uft_actions_sequence = []
-        self.original_domain = get_domain(web_app_url)
+        self.observation_space = gym.spaces.Box(low=0, high=1, shape=(observation_size,), dtype=np.float32)
 
-        # Initialize the environment by navigating to the original URL
-        self.driver.get(web_app_url)
-        self.actions_sequence.append(f'driver.get("{web_app_url}")')
-        self.uft_actions_sequence.append(f'Browser("browser_name").Navigate {web_app_url}')
+        self.current_step = 0
+        self.action_history = deque(maxlen=action_history_length)
+        self.alert_present = False
+        self.last_url = None
+        self.current_state_id = None
+        # The snapshot taken at the end of a step describes the page the next step acts on
+        self.last_snapshot = None
+        # Errors drained from the page by every snapshot, until check_for_and_log_errors records them
+        self.pending_page_errors = []
+        # Signatures of the errors collected in the page since the browser log was last read, so the log
+        # does not record them a second time
+        self.page_error_signatures = set()
+        self.trace = None
+        self.session_keys = None
+        # States this worker has reached since it started. The coverage index is shared and kept between
+        # runs, so its novelty count cannot tell when this process reaches a state it has no session for.
+        self.session_states = set()
+        self.original_domain = get_domain(self.web_app_url)
+
+        # Initialize the environment by navigating to the original URL with a clean session
+        self.start_trace()
+        self.clear_session()
+        self.navigate(self.web_app_url)
+        self.session_store.set_baseline(self.driver)
+        self.state = self.observe()  # Initial state
+        self.start_episode()
 
     def reset(self):
-        self.state = 0
+        self.coverage.flush()
         self.current_step = 0
-        self.driver.get(web_app_url)
-        self.actions_sequence = [f'driver.get("{web_app_url}")']  # Reset actions sequence with the initial navigation
-        self.uft_actions_sequence = [f'Browser("browser_name").Navigate {web_app_url}']
+        self.action_history.clear()
+        self.alert_present = False
+        self.last_url = None
+        # Record the errors the previous episode left unchecked, including browser log entries not polled yet
+        self.check_for_and_log_errors(poll_browser_log=True)
+        self.episode_actions.clear()
+        self.start_trace()  # Start a new trace with the initial navigation
+        # Every episode starts from a clean session, so its trace reproduces it from a fresh browser
+        self.clear_session()
+
+        # Sometimes start the episode from a saved session, such as logged in or with a filled cart
+        checkpoint = None
+        if self.session_store.checkpoints and random.random() < session_restore_probability:
+            checkpoint = self.session_store.choose()
+        if checkpoint is not None and self.restore_session(checkpoint):
+            self.state = self.observe()
+        else:
+            self.navigate(self.web_app_url)
+            self.session_store.set_baseline(self.driver)
+            self.state = self.observe()
+
+            # Sometimes start the episode deep in the application instead of on the landing page, and always
+            # when the last episode was ended early, so the time it saved goes to the least explored states
+            # Observe again even when the teleport failed, since it may have navigated away and back
+            if self.scheduler.stop_reason is not None or random.random() < teleport_probability:
+                self.teleport_to_frontier()
+                self.state = self.observe()
+        self.start_episode()
         return self.state
 
-    def handle_interactable_exception(self, action, valid_elements):
-        try:
-            element_to_interact = random.choice(valid_elements)
-            element_xpath = get_robust_xpath(element_to_interact)
-            action_str = f'driver.find_element(By.XPATH, \'{element_xpath}\').{actions[action]}()'
-            uft_action_str = f'Browser("browser_name").Page("page_name").WebButton("xpath=\'{element_xpath}\'").{actions[action]}'
-
-            # Check if the current action_str is in the cache
-            if action_str in action_str_cache:
-                print(f"Skipping step as action_str '{action_str}' is in the cache.")
-                return self.state, 0, False, {}
+    def start_episode(self):
+        # Record the state the episode starts in, so the first step is not rewarded for reaching it
+        if self.current_state_id is not None:
+            self.coverage.record_state(self.current_state_id, self.last_url)
+            self.session_states.add(self.current_state_id)
+        self.session_keys = self.last_snapshot["session_keys"] if self.last_snapshot is not None else None
+        self.scheduler.start_episode(self.current_state_id)
 
-            if action_str != self.actions_sequence[-1]:
-                getattr(element_to_interact, actions[action])()
-                self.actions_sequence.append(action_str)
-                self.uft_actions_sequence.append(uft_action_str)
+    def clear_session(self):
+        try:
+            clear_browser_state(self.driver, [self.web_app_url, self.driver.current_url])
+        except Exception as e:
+            print(f"Unable to clear the browser session: {e}")
 
-        except ElementNotInteractableException:
-            # Handle ElementNotInteractableException by recursively calling the method
-            valid_elements.remove(element_to_interact)
-            if valid_elements:
-                self.handle_interactable_exception(action, valid_elements)
+    def restore_session(self, checkpoint):
+        # The trace starts with the actions that originally led to the checkpoint, so it can still be replayed
+        try:
+            for record in checkpoint["records"]:
+                self.trace_records.append(self.trace.write(record["action"], record["locator"], record["value"], record["url"], record["duration"]))
+            with self.profiler.measure("session_restore"):
+                self.session_store.restore(self.driver, checkpoint)
+            self.wait_for_settle()
+            print(f"Restored the session checkpoint at {checkpoint['url']}")
+            return True
+        except Exception as e:
+            print(f"Unable to restore the session checkpoint at {checkpoint['url']}: {e}")
+            self.start_trace(discard_current=True)
+            self.clear_session()
+            return False
+
+    def capture_session(self):
+        # Save the session together with the actions of the episode so far, which lead to it from a clean session
+        if self.session_store.is_full():
+            return
+        try:
+            with self.profiler.measure("session_capture"):
+                self.session_store.capture(self.driver, self.last_url, self.trace_records)
+        except Exception as e:
+            print(f"Unable to save the session: {e}")
+
+    def start_trace(self, discard_current=False):
+        # Every episode gets its own trace file, written step by step
+        if self.trace is not None:
+            self.trace.close(delete=discard_current)
+        self.trace = TraceWriter(self.output_dir, self.worker_index)
+        # The records of the episode are also kept in memory for session checkpoints
+        self.trace_records = []
+
+    def record_action(self, action_name, element_xpath="", value="", url="", start_time=None):
+        # Append the action to the episode trace as soon as it has been performed
+        duration = time.perf_counter() - start_time if start_time is not None else 0.0
+        self.profiler.add("action", duration)
+        self.trace_records.append(self.trace.write(action_name, element_xpath, value, url, duration))
+
+    def navigate(self, url):
+        start_time = time.perf_counter()
+        self.driver.get(url)
+        self.record_action("navigate", "", url, url, start_time)
+        self.wait_for_settle()
+
+    def wait_for_settle(self):
+        with self.profiler.measure("settle"):
+            self.wait_policy.wait(self.driver)
+
+    def perform_recorded_action(self, action_name, element_xpath, value):
+        # Repeat an action recorded in the navigation graph and add it to the trace
+        start_time = time.perf_counter()
+        current_url = self.driver.current_url
+        if action_name == "navigate":
+            self.driver.get(value)
+        elif action_name == "scroll":
+            self.driver.execute_script(f"window.scrollBy(0, {int(value)});")
+        else:
+            element = self.driver.find_element(By.XPATH, element_xpath)
+            if action_name == "input_text":
+                element.clear()
+                element.send_keys(value)
+            elif action_name == "enter_date":
+                element.send_keys(value)
+            elif action_name == "select_option":
+                Select(element).select_by_value(value)
             else:
-                print(f"All elements are not interactable for action: {actions[action]}")
+                element.click()
+
+        self.record_action(action_name, element_xpath, value, current_url, start_time)
+        self.wait_for_settle()
+
+    def teleport_to_frontier(self):
+        # Jump from the landing page to one of the least explored recorded states, by URL when the
+        # state can be reached directly and otherwise by the shortest recorded action path
+        start_state_id = self.current_state_id
+        if start_state_id is None:
+            return False
+
+        for state_id, url, addressable in self.coverage.get_frontier_states(start_state_id, self.original_domain):
+            try:
+                if addressable != 0:
+                    self.navigate(url)
+                    if get_state_id(self.take_snapshot()) == state_id:
+                        self.coverage.set_addressable(state_id, True)
+                        print(f"Teleported to {url} by URL")
+                        return True
+
+                    # The state depends on how it was reached, so go back and try the recorded path
+                    self.coverage.set_addressable(state_id, False)
+                    self.navigate(self.web_app_url)
+
+                path = self.coverage.get_shortest_path(start_state_id, state_id, max_teleport_path_length)
+                if path is None:
+                    continue
+                for action_name, element_xpath, value in path:
+                    self.perform_recorded_action(action_name, element_xpath, value)
+                print(f"Teleported to {url} with {len(path)} recorded actions")
+                return True
+            except Exception as e:
+                print(f"Unable to teleport to {url}: {e}")
+                # Close an alert the recorded path may have left open, then start over from the landing
+                # page with a clean trace and session and try the next frontier state
+                try:
+                    self.driver.switch_to.alert.dismiss()
+                except Exception:
+                    pass
+                self.start_trace(discard_current=True)
+                self.clear_session()
+                self.navigate(self.web_app_url)
+                continue
+
+        return False
+
+    def observe(self):
+        # Snapshot the page after an action; the same snapshot is reused by the next step
+        try:
+            self.last_snapshot = self.take_snapshot()
+        except Exception as e:
+            print(f"Unable to snapshot the page: {e}")
+            self.last_snapshot = None
+
+        current_url = self.last_snapshot["url"] if self.last_snapshot is not None else None
+        self.current_state_id = get_state_id(self.last_snapshot) if self.last_snapshot is not None else None
+        url_changed = self.last_url is not None and current_url != self.last_url
+        self.last_url = current_url
+        return encode_observation(self.last_snapshot, self.action_history, self.alert_present, url_changed, self.current_step)
+
+    def prefetch_sample_values(self, snapshot):
+        # Queue LLM generation for every usable field so answers are ready by the time they are needed
+        fields = []
+        for action_name in ("input_text", "enter_date"):
+            for candidate in get_valid_candidates(snapshot, action_name):
+                fields.append((action_name, get_field_signature(candidate["field"])))
+        self.value_generator.prefetch_fields(fields)
+
+    def take_snapshot(self):
+        # Collect the current URL and all candidate elements in one round-trip
+        with self.profiler.measure("discovery"):
+            snapshot = self.driver.execute_script(snapshot_script, action_selectors)
+        # Taking the snapshot empties the page's error buffer, so keep its errors until they are checked
+        self.pending_page_errors.extend(snapshot["errors"])
+        return snapshot
+
+    def locate(self, candidate):
+        # Build the verified locator of the element about to be acted on, trying the strategy that worked
+        # for its signature first
+        signature = candidate["signature"]
+        cached_strategies = {signature: self.locator_strategies[signature]} if signature in self.locator_strategies else {}
+        with self.profiler.measure("locator"):
+            located = self.driver.execute_script(locate_element_script, candidate["element"], cached_strategies)
+
+        # Remember which locator strategy worked for each element signature, keeping the most recent ones
+        self.locator_strategies.pop(signature, None)
+        self.locator_strategies[signature] = located["strategy"]
+        while len(self.locator_strategies) > locator_cache_size:
+            self.locator_strategies.popitem(last=False)
+        return located["locator"]
+
+    def choose_untried(self, options):
+        # Pick a random (action key, choice) pair, preferring actions never tried in this state by this
+        # worker, then actions not tried in this episode, and only then any of them
+        untried = [option for option in options if option[0] not in self.episode_actions and option[0] not in self.global_actions]
+        if not untried:
+            untried = [option for option in options if option[0] not in self.episode_actions]
+        return random.choice(untried or options)
+
+    def get_sample_value(self, kind, signature):
+        # Time the lookup of a field value, telling LLM cache hits from heuristic fallbacks
+        heuristic_values_used = self.value_generator.heuristic_values_used
+        start_time = time.perf_counter()
+        value = self.value_generator.get_value(kind, signature)
+        section = "llm_miss" if self.value_generator.heuristic_values_used > heuristic_values_used else "llm_hit"
+        self.profiler.add(section, time.perf_counter() - start_time)
+        return value
 
     def step(self, action):
-        action_str = ""
+        with self.profiler.measure("step"):
+            result = self.perform_step(action)
+        self.profiler.end_step()
+        return result
+
+    def perform_step(self, action):
+        action_key = None
+        element_xpath = ""
+        action_value = ""
 
         if self.current_step >= max_steps:
             self.log_actions()  # Log actions even if max steps are reached
             return self.state, 0, True, {}  # End of episode
 
         print("Selected Action: " + str(action))
+        trace_records = self.trace.records
+        self.steps_taken += 1
+        self.action_history.append(action)
+        self.alert_present = False
 
         try:
+            # Reuse the snapshot taken at the end of the previous step, which already holds the URL
+            # and all candidate elements, and only take a new one if it is missing
+            if self.last_snapshot is not None:
+                snapshot = self.last_snapshot
+                state_id = self.current_state_id
+            else:
+                snapshot = self.take_snapshot()
+                state_id = get_state_id(snapshot)
+            # The action below may change the page, so the snapshot must not be reused afterwards
+            self.last_snapshot = None
+            self.prefetch_sample_values(snapshot)
+
             # Check if the current domain is different from the original domain
-            current_domain = get_domain(self.driver.current_url)
+            current_domain = get_domain(snapshot["url"])
             if current_domain != self.original_domain:
-                self.driver.get(web_app_url)  # Navigate back to the original URL
-                self.actions_sequence.append(f'driver.get("{web_app_url}")')
-                self.uft_actions_sequence.append(f'Browser("browser_name").Navigate {web_app_url}')
+                self.navigate(self.web_app_url)  # Navigate back to the original URL
 
                 self.current_step += 1  # Increment the step count
+                self.state = self.observe()
+
+                # The page left behind may have raised errors, and the step still counts towards the episode
+                with self.profiler.measure("error_check"):
+                    errors_found = self.check_for_and_log_errors()
+                if errors_found:
+                    return self.state, self.current_step, True, {}
+                stop_reason = self.scheduler.record_step(self.current_state_id, 0)
+                if stop_reason is not None:
+                    print(f"Ending the episode after {self.current_step} steps: {stop_reason}")
+                    return self.state, 0, True, {}
                 return self.state, 0, False, {}
             else:
                 # Perform the selected action
-                previous_action = self.actions_sequence[-1] if self.actions_sequence else None
+                current_url = snapshot["url"]
 
                 if action == 0:  # Click
-                    # Find clickable elements using CSS selectors
-                    clickable_elements = self.driver.find_elements(By.CSS_SELECTOR, 'a, button, input[type="submit"]')
-                    valid_clickable_elements = [element for element in clickable_elements if element.is_displayed() and element.is_enabled()]
-
-                    if valid_clickable_elements:
+                    valid_clickable_elements = get_valid_candidates(snapshot, "click")
+
+                    # Try the next element that has not been clicked yet when one is not interactable
+                    while valid_clickable_elements:
+                        action_key, element_to_click = self.choose_untried([
+                            ((state_id, "click", candidate["signature"]), candidate) for candidate in valid_clickable_elements
+                        ])
+                        element_xpath = self.locate(element_to_click)
                         try:
-                            element_to_click = random.choice(valid_clickable_elements)
-                            element_xpath = get_robust_xpath(element_to_click)
-                            action_str = f'driver.find_element(By.XPATH, \'{element_xpath}\').click()'
-                            uft_action_str = f'Browser("browser_name").Page("page_name").WebButton("xpath=\'{element_xpath}\'").Click'
-
-                            # Check if the current action_str is in the cache
-                            if action_str in action_str_cache:
-                                print(f"Skipping step as action_str '{action_str}' is in the cache.")
-                                return self.state, 0, False, {}
-
-                            if action_str != previous_action:
-                                element_to_click.click()
-                                self.actions_sequence.append(action_str)
-                                self.uft_actions_sequence.append(uft_action_str)
+                            start_time = time.perf_counter()
+                            element_to_click["element"].click()
+                            self.record_action("click", element_xpath, "", current_url, start_time)
+                            break
                         except ElementNotInteractableException:
-                            self.handle_interactable_exception(action, valid_clickable_elements)
+                            valid_clickable_elements.remove(element_to_click)
+                            if not valid_clickable_elements:
+                                print(f"All elements are not interactable for action: {actions[action]}")
 
                 elif action == 1:  # Input Text
-                    # Find input fields using CSS selectors
-                    input_elements = self.driver.find_elements(By.CSS_SELECTOR, 'input[type="text"], input[type="password"], input[type="email"]')
-                    valid_input_elements = [element for element in input_elements if element.is_displayed() and element.is_enabled()]
+                    valid_input_elements = get_valid_candidates(snapshot, "input_text")
 
                     if valid_input_elements:
-                        element_to_input = random.choice(valid_input_elements)
-
-                        # Get outerHTML of the element
-                        outer_html = element_to_input.get_attribute("outerHTML")
-                        escaped_outer_html = urllib.parse.quote(outer_html, safe='')
-
-                        messages = [{"role": "system", "content": f"What is a valid sample value I could use for this HTML input element? Please respond ONLY with a valid sample value in double quotes AND NOTHING ELSE: {escaped_outer_html}"}]
-
-                        response_str = ""
-
-                        # Convert the first dictionary in messages to a tuple of (key, value) pairs
-                        messages_tuple = tuple(messages[0].items())
-                        
-                        if messages_tuple in llama_cache:
-                            print(f"Using cached response for messages: {messages}")
-                            response_str = llama_cache[messages_tuple]
-                        else:
-                            try:
-                                # Call the model and update the llama cache
-                                response = llama.create_chat_completion(messages=messages)
-                                print("Full Response:")
-                                print(response)
-                                response_str = response['choices'][0]['message']['content'].strip()
-                                print("Question: " + messages[0]['content'])
-                                print("Answer: " + response_str)
-
-                                # Extract the part in double-quotes
-                                match = re.search(r'"([^"]*)"', response_str)
-                                if match:
-                                    response_str = match.group(1)
-
-                                llama_cache[messages_tuple] = response_str
-                            except Exception as e:
-                                print(f"Error calling LLM: {e}")
-
-                        print("Sample input text provided by LLM: " + response_str)
-
-                        element_xpath = get_robust_xpath(element_to_input)
-                        action_str = f'element = driver.find_element(By.XPATH, \'{element_xpath}\'); element.clear(); element.send_keys("{response_str}")'
-                        uft_action_str = f'Browser("browser_name").Page("page_name").WebEdit("xpath=\'{element_xpath}\'").Set "{response_str}"'
-
-                        # Check if the current action_str is in the cache
-                        if action_str in action_str_cache:
-                            print(f"Skipping step as action_str '{action_str}' is in the cache.")
-                            return self.state, 0, False, {}
-
-                        if action_str != previous_action:
-                            # Clear existing text before entering new text
-                            element_to_input.clear()
-                            element_to_input.send_keys(response_str)
-                            self.actions_sequence.append(action_str)
-                            self.uft_actions_sequence.append(uft_action_str)
+                        action_key, element_to_input = self.choose_untried([
+                            ((state_id, "input_text", candidate["signature"]), candidate) for candidate in valid_input_elements
+                        ])
+
+                        # Reduce the element to its semantic signature so equivalent fields share one answer
+                        signature = get_field_signature(element_to_input["field"])
+                        response_str = self.get_sample_value("input_text", signature)
+
+                        element_xpath = self.locate(element_to_input)
+                        action_value = response_str
+                        start_time = time.perf_counter()
+                        # Clear existing text before entering new text
+                        element_to_input["element"].clear()
+                        element_to_input["element"].send_keys(response_str)
+                        self.record_action("input_text", element_xpath, action_value, current_url, start_time)
 
                 elif action == 2:  # Scroll
-                    # Scroll the page (you can change the scroll amount)
-                    scroll_amount = random.randint(1, 3) * 200  # You can adjust the scroll amount as needed
-                    script_to_execute = f"window.scrollBy(0, {scroll_amount});";
-                    action_str = f'driver.execute_script("window.scrollBy(0, {scroll_amount});")'
-                    uft_action_str = f'Browser("browser_name").Page("page_name").Object.parentWindow.scrollBy 0, {scroll_amount}'
-
-                    # Check if the current action_str is in the cache
-                    if action_str in action_str_cache:
-                        print(f"Skipping step as action_str '{action_str}' is in the cache.")
-                        return self.state, 0, False, {}
-
-                    if action_str != previous_action:
-                        self.driver.execute_script(script_to_execute)
-                        self.actions_sequence.append(action_str)
-                        self.uft_actions_sequence.append(uft_action_str)
+                    # Scroll the page (you can change the scroll amounts); the same amount from a new position is a new action
+                    scroll_position = round(snapshot["scroll_ratio"], 1)
+                    action_key, scroll_amount = self.choose_untried([
+                        ((state_id, "scroll", f"{amount}@{scroll_position}"), amount) for amount in scroll_amounts
+                    ])
+                    action_value = str(scroll_amount)
+                    start_time = time.perf_counter()
+                    self.driver.execute_script(f"window.scrollBy(0, {scroll_amount});")
+                    self.record_action("scroll", "", action_value, current_url, start_time)
 
                 elif action == 3:  # Select Option
-                    # Find select elements using CSS selectors
-                    select_elements = self.driver.find_elements(By.CSS_SELECTOR, 'select')
-                    valid_select_elements = [element for element in select_elements if element.is_displayed() and element.is_enabled()]
-
-                    if valid_select_elements:
-                        element_to_select = random.choice(valid_select_elements)
-                        select = Select(element_to_select)
-                        options = select.options
-                        if options:
-                            random_option = random.choice(options)
-                            element_xpath = get_robust_xpath(element_to_select)
-                            action_str = f'element = driver.find_element(By.XPATH, \'{element_xpath}\'); Select(element).select_by_value("{random_option.get_attribute("value")}")'
-                            uft_action_str = f'Browser("browser_name").Page("page_name").WebList("xpath=\'{element_xpath}\'").Select "{random_option.get_attribute("value")}"'
-
-                            # Check if the current action_str is in the cache
-                            if action_str in action_str_cache:
-                                print(f"Skipping step as action_str '{action_str}' is in the cache.")
-                                return self.state, 0, False, {}
-
-                            if action_str != previous_action:
-                                select.select_by_value(random_option.get_attribute("value"))
-                                self.actions_sequence.append(action_str)
-                                self.uft_actions_sequence.append(uft_action_str)
+                    # Option values come from the snapshot, so no per-option round-trips are needed
+                    select_options = [
+                        ((state_id, "select_option", f"{candidate['signature']}={option}"), (candidate, option))
+                        for candidate in get_valid_candidates(snapshot, "select_option") for option in candidate["options"]
+                    ]
+
+                    if select_options:
+                        action_key, (element_to_select, random_option) = self.choose_untried(select_options)
+                        element_xpath = self.locate(element_to_select)
+                        action_value = random_option
+                        start_time = time.perf_counter()
+                        Select(element_to_select["element"]).select_by_value(random_option)
+                        self.record_action("select_option", element_xpath, action_value, current_url, start_time)
 
                 elif action == 4:  # Enter Date
-                    # Find date input fields using CSS selectors
-                    date_input_elements = self.driver.find_elements(By.CSS_SELECTOR, 'input[type="date"]')
-                    valid_date_input_elements = [element for element in date_input_elements if element.is_displayed() and element.is_enabled()]
+                    valid_date_input_elements = get_valid_candidates(snapshot, "enter_date")
 
                     if valid_date_input_elements:
-                        element_to_input = random.choice(valid_date_input_elements)
-
-                        # Get outerHTML of the element
-                        outer_html = element_to_input.get_attribute("outerHTML")
-                        escaped_outer_html = urllib.parse.quote(outer_html, safe='')
-
-                        messages = [{"role": "system", "content": f"What is a valid sample date I could use for this HTML input element? Please respond ONLY with the valid sample value in double quotes and NOTHING ELSE: {escaped_outer_html}"}]
-
-                        response_str = ""
-
-                        # Convert the first dictionary in messages to a tuple of (key, value) pairs
-                        messages_tuple = tuple(messages[0].items())
-
-                        if messages_tuple in llama_cache:
-                            print(f"Using cached response for messages: {messages}")
-                            response_str = llama_cache[messages_tuple]
-                        else:
-                            try:
-                                # Call the model and update the llama cache
-                                response = llama.create_chat_completion(messages=messages)
-                                print("Full Response:")
-                                print(response)
-                                response_str = response['choices'][0]['message']['content'].strip()
-                                print("Question: " + messages[0]['content'])
-                                print("Answer: " + response_str)
-
-                                # Extract the part in double-quotes
-                                match = re.search(r'"([^"]*)"', response_str)
-                                if match:
-                                    response_str = match.group(1)
-
-                                llama_cache[messages_tuple] = response_str
-                            except Exception as e:
-                                print(f"Error calling LLM: {e}")
-
-                        element_xpath = get_robust_xpath(element_to_input)
-                        action_str = f'driver.find_element(By.XPATH, \'{element_xpath}\').send_keys("{response_str}")'
-                        uft_action_str = f'Browser("browser_name").Page("page_name").WebEdit("xpath=\'{element_xpath}\'").Set "{response_str}"'
-
-                        # Check if the current action_str is in the cache
-                        if action_str in action_str_cache:
-                            print(f"Skipping step as action_str '{action_str}' is in the cache.")
-                            return self.state, 0, False, {}
-
-                        if action_str != previous_action:
-                            element_to_input.send_keys(response_str)
-                            self.actions_sequence.append(action_str)
-                            self.uft_actions_sequence.append(uft_action_str)
-                            #
+                        action_key, element_to_input = self.choose_untried([
+                            ((state_id, "enter_date", candidate["signature"]), candidate) for candidate in valid_date_input_elements
+                        ])
+
+                        # Reduce the element to its semantic signature so equivalent fields share one answer
+                        signature = get_field_signature(element_to_input["field"])
+                        response_str = self.get_sample_value("enter_date", signature)
+
+                        element_xpath = self.locate(element_to_input)
+                        action_value = response_str
+                        start_time = time.perf_counter()
+                        element_to_input["element"].send_keys(response_str)
+                        self.record_action("enter_date", element_xpath, action_value, current_url, start_time)
 
                 elif action == 5:  # Select Radio
-                    # Find radio elements using CSS selectors
-                    radio_elements = self.driver.find_elements(By.CSS_SELECTOR, 'input[type="radio"]')
-                    valid_radio_elements = [element for element in radio_elements if element.is_displayed() and element.is_enabled()]
+                    valid_radio_elements = get_valid_candidates(snapshot, "select_radio")
 
                     if valid_radio_elements:
-                        element_to_select = random.choice(valid_radio_elements)
-                        element_xpath = get_robust_xpath(element_to_select)
-                        action_str = f'driver.find_element(By.XPATH, \'{element_xpath}\').click()'
-                        uft_action_str = f'Browser("browser_name").Page("page_name").WebRadioGroup("xpath=\'{element_xpath}\'").Select'
-
-                        # Check if the current action_str is in the cache
-                        if action_str in action_str_cache:
-                            print(f"Skipping step as action_str '{action_str}' is in the cache.")
-                            return self.state, 0, False, {}
+                        action_key, element_to_select = self.choose_untried([
+                            ((state_id, "select_radio", candidate["signature"]), candidate) for candidate in valid_radio_elements
+                        ])
+                        element_xpath = self.locate(element_to_select)
+                        start_time = time.perf_counter()
+                        element_to_select["element"].click()
+                        self.record_action("select_radio", element_xpath, "", current_url, start_time)
 
-                        if action_str != previous_action:
-                            element_to_select.click()
-                            self.actions_sequence.append(action_str)
-                            self.uft_actions_sequence.append(uft_action_str)
+            # Wait for the page to settle before looking at the result of the action
+            self.wait_for_settle()
 
             # Check for unexpected alerts
-            try:
-                alert = self.driver.switch_to.alert
-
-                if random.choice([True, False]):  # Randomly accept or dismiss
-                    alert.accept()  # Accept the alert (click OK)
-                    self.actions_sequence.append('alert.accept()')
-                    self.uft_actions_sequence.append('Browser("browser_name").Page("page_name").Dialog("micClass:=Dialog").Close micOk')
-                else:
-                    alert.dismiss()  # Dismiss the alert (click Cancel)
-                    self.actions_sequence.append('alert.dismiss()')
-                    self.uft_actions_sequence.append('Browser("browser_name").Page("page_name").Dialog("micClass:=Dialog").Close micCancel')
-            except Exception:
-                pass  # No alert found
+            with self.profiler.measure("alert"):
+                try:
+                    alert = self.driver.switch_to.alert
+                    self.alert_present = True
+                    start_time = time.perf_counter()
+
+                    if random.choice([True, False]):  # Randomly accept or dismiss
+                        alert.accept()  # Accept the alert (click OK)
+                        self.record_action("accept_alert", "", "", snapshot["url"], start_time)
+                    else:
+                        alert.dismiss()  # Dismiss the alert (click Cancel)
+                        self.record_action("dismiss_alert", "", "", snapshot["url"], start_time)
+                    self.wait_for_settle()
+                except Exception:
+                    pass  # No alert found
 
         except Exception as e:
-            # Clear the cache in case it is contributing
-            self.llama_cache = {}
             print(str(e))
             pass  # Continue to the next action
 
-        # Update the action_str cache
-        action_str_cache.append(action_str)
-        if len(action_str_cache) > 20:
-            action_str_cache.pop(0)
+        # Remember the action so that untried actions are preferred from now on
+        if action_key is not None:
+            self.episode_actions.add(action_key)
+            self.global_actions.add(action_key)
 
-        # Check for JavaScript errors in the console logs
-        if self.check_for_and_log_errors():
-            self.log_actions()  # Log actions when an error is encountered
-            reward = self.current_step + 1  # Reward increases with each step to maximize steps
+        self.current_step += 1
+        previous_state_id = self.current_state_id
+        self.state = self.observe()
+
+        # Check for JavaScript errors collected by the snapshot and in the browser log
+        with self.profiler.measure("error_check"):
+            errors_found = self.check_for_and_log_errors()
+        if errors_found:
+            reward = self.current_step  # Reward increases with each step to maximize steps
             return self.state, reward, True, {}  # End of episode
 
-        self.current_step += 1
-        self.state = self.current_step
-        return self.state, 0, False, {}
+        # Reward reaching states and making transitions that have never been seen before; a step that
+        # performed no action made no transition and is neither recorded nor rewarded
+        known_new_states = self.coverage.new_states
+        reward = 0.0
+        if self.trace.records > trace_records:
+            reward = self.coverage.get_novelty_reward(previous_state_id, actions[action], element_xpath, action_value, self.current_state_id, self.last_url)
+
+        # Save the session when the step reached a state new to this worker or changed the cookies or storage
+        # the page sees. HttpOnly cookies are not visible to the page, but a login setting one usually leads
+        # to a new state; the store compares the full cookie signature and skips sessions it already has.
+        if self.last_snapshot is not None:
+            new_state = self.current_state_id not in self.session_states
+            self.session_states.add(self.current_state_id)
+            if new_state or self.last_snapshot["session_keys"] != self.session_keys:
+                self.session_keys = self.last_snapshot["session_keys"]
+                self.capture_session()
+
+        # End the episode early when it has stopped finding new states or used up its time
+        stop_reason = self.scheduler.record_step(self.current_state_id, self.coverage.new_states - known_new_states)
+        if stop_reason is not None:
+            print(f"Ending the episode after {self.current_step} steps: {stop_reason}")
+            return self.state, reward, True, {}
+        return self.state, reward, False, {}
 
     def render(self):
         pass
 
-    def close(self):
-        self.driver.quit()
+    def episode_stats(self):
+        return self.scheduler.stats()
 
-    def check_for_and_log_errors(self):
-        current_url = self.driver.current_url
-        current_time = time.strftime("%Y%m%d%H%M%S")
-        sanitized_url = "".join(c if c.isalnum() or c in ['.', '-', '_'] else '_' for c in current_url)
+    def save_state(self):
+        # Write the buffered coverage visits; LLM answers, errors and trace steps are already written as they happen
+        self.coverage.flush()
 
-        # Redirect the script output to the error log file
-        error_log_file = os.path.join(subfolder, f"Error_{current_time}.log")
+    def close(self):
+        elapsed = time.perf_counter() - self.start_time
+        browser_rss = get_browser_rss(self.driver)
+        print(f"Browser statistics for worker {self.worker_index}: {self.steps_taken / elapsed if elapsed > 0 else 0.0:.2f} steps per second, {browser_rss / (1024 * 1024):.0f} MB RSS")
+        self.driver.quit()
+        self.trace.close()
+        print(f"Sample value statistics for worker {self.worker_index}: {self.value_generator.stats()}")
+        self.value_generator.close()
+        self.value_generator.llama_cache.close()
+        print(f"Coverage statistics for worker {self.worker_index}: {self.coverage.stats()}")
+        print(f"Episode statistics for worker {self.worker_index}: {self.scheduler.stats()}")
+        print(f"Session checkpoint statistics for worker {self.worker_index}: {self.session_store.stats()}")
+        print(f"Page settle statistics for worker {self.worker_index}: {self.wait_policy.stats()}")
+        print(f"Error statistics for worker {self.worker_index}: {self.error_index.stats()}")
+        if self.profiler.enabled:
+            self.profiler.write_summary(os.path.join(self.output_dir, f"profile_worker_{self.worker_index}.json"))
+        self.profiler.close()
+        self.error_index.close()
+        self.coverage.close()
+
+    def check_for_and_log_errors(self, poll_browser_log=False):
         errors_found = False
         error_messages = []
+        messages = []
 
-        # Check for unhandled exceptions on the page
-        stack_trace_elements = self.driver.find_elements(By.XPATH, '//*[contains(text(), "unhandled exception")]')
-        if stack_trace_elements:
+        # Uncaught errors, rejections, console errors and error text collected in the page by every snapshot since the last check
+        page_errors = self.pending_page_errors
+        self.pending_page_errors = []
+        for error in page_errors:
             errors_found = True
-            for element in stack_trace_elements:
-                error_messages.append('Unhandled Exception: \n' + element.text + '\n')
-
-        logs = self.driver.get_log('browser')
-        for log in logs:
-            if log['level'] in ('SEVERE', 'ERROR'):
+            print(f"SAVING [{error['type']}] - {error['message']}")
+            error_messages.append(f"[{error['type']}] - {error['message']}\n")
+            messages.append(error['message'])
+            signature = normalize_error_message(error['message'])
+            if signature:
+                self.page_error_signatures.add(signature)
+
+        # Every few steps, read the errors the browser logged. Script and console errors are usually already
+        # collected in the page, but not those of a page that was left before a snapshot drained them, so
+        # they are only skipped when their message matches an error collected in the page since the last read.
+        self.steps_since_log_poll += 1
+        if poll_browser_log or self.steps_since_log_poll >= browser_log_interval:
+            self.steps_since_log_poll = 0
+            collected_signatures = self.page_error_signatures
+            self.page_error_signatures = set()
+            for log in self.driver.get_log('browser'):
+                if log['level'] not in ('SEVERE', 'ERROR'):
+                    continue
+                if log.get('source') in ('javascript', 'console-api'):
+                    log_signature = normalize_error_message(log['message'])
+                    if any(signature in log_signature for signature in collected_signatures):
+                        continue
                 errors_found = True
                 print(f"SAVING [{log['level']}] - {log['message']}")
                 error_messages.append(f"[{log['level']}] - {log['message']}\n")
-
-        if errors_found:
-            # Open the error log file and write the contents
+                messages.append(log['message'])
+
+        if not errors_found:
+            return False
+
+        # Count every error by its signature, but only keep files for the first occurrences of each one
+        save_files = False
+        export_trace = False
+        recorded = []
+        for message in messages:
+            signature_id, occurrences, is_shortest = self.error_index.record(message, self.trace.path, self.trace.records)
+            recorded.append(signature_id)
+            if self.error_index.should_save(occurrences):
+                save_files = True
+            export_trace = export_trace or is_shortest
+
+        if save_files:
+            current_time = time.strftime("%Y%m%d%H%M%S")
+            # Several errors can be saved within a second, so the worker and a random id keep the files apart
+            error_file_name = f"Error_{current_time}_w{self.worker_index}_{uuid.uuid4().hex[:8]}"
+            error_log_file = os.path.join(self.output_dir, f"{error_file_name}.log")
+
+            # Open the error log file and write the contents, starting with the trace that led to the errors
             with open(error_log_file, "w") as log_file:
+                log_file.write(f"Trace: {self.trace.path}\n")
                 for message in error_messages:
                     log_file.write(message)
 
             # Capture screenshot of the page
-            screenshot_file = os.path.join(subfolder, f"Error_{current_time}.png")
+            screenshot_file = os.path.join(self.output_dir, f"{error_file_name}.png")
             self.driver.save_screenshot(screenshot_file)
             print(f"Screenshot saved as {screenshot_file}")
             print(f"Error log saved as {error_log_file}")
 
-        return errors_found
+            for signature_id in recorded:
+                self.error_index.set_files(signature_id, error_log_file, screenshot_file)
+        else:
+            print(f"Skipping files for {len(messages)} known errors")
 
-    def log_actions(self):
-        current_url = self.driver.current_url
-        current_time = time.strftime("%Y%m%d%H%M%S")
-        sanitized_url = "".join(c if c.isalnum() or c in ['.', '-', '_'] else '_' for c in current_url)
+        # Scripts are only generated for traces that come with error files or reproduce an error in fewer steps
+        if save_files or export_trace:
+            self.log_actions()
+        return True
 
+    def log_actions(self):
         try:
-            # Save generated Selenium steps script
-            if self.actions_sequence:
-                selenium_steps_file = os.path.join(subfolder, f"Steps_{current_time}.py")
-
-                with open(selenium_steps_file, "w") as actions_file:
-                    for action in self.actions_sequence:
-                        actions_file.write(f"{action}\n")
-
-                print(f"Generated Selenium steps saved as {selenium_steps_file}")
-                uft_steps_file = os.path.join(subfolder, f"UFT_Steps_{current_time}.vb")
-
-                with open(uft_steps_file, "w") as uft_actions_file:
-                    for action in self.uft_actions_sequence:
-                        uft_actions_file.write(f"{action}\n")
-
-                print(f"Generated UFT steps saved as {uft_steps_file}")
+            # Generate the Selenium and UFT steps scripts from the episode trace
+            selenium_steps_file, uft_steps_file = export_scripts(self.trace.path)
+            print(f"Generated Selenium steps saved as {selenium_steps_file}")
+            print(f"Generated UFT steps saved as {uft_steps_file}")
         except Exception as e:
             print(f"Exception encountered while saving actions: {e}")
 
-try:
-    # Define the model path
-    model_path = os.path.join(model_dir, "ppo_web_app_model.zip")
-
-    # Create or load the model
-    env = DummyVecEnv([lambda: WebAppEnv(driver, llama_cache)])
-    if os.path.exists(model_path):
-        # Load the pre-trained reinforcement learning model
-        model = PPO.load(model_path)
-    else:
-        model = PPO("MlpPolicy", env, verbose=1, tensorboard_log="./ppo_web_app_tensorboard/")
-
-    print(f"Training the model")
-    # Train a Proximal Policy Optimization (PPO) agent
-    model.learn(total_timesteps=max_episodes * max_steps)
-
-    print(f"Saving the model")
-    # Save the trained model
-    model.save(model_path)
-
-    # Test the trained agent
-    for episode in range(max_episodes):
-        print(f"Episode {episode + 1}/{max_episodes}")
+# Function to combine the profile summaries written by the workers with the training profile
+def write_profile_summary(training_profiler, num_workers, output_root=subfolder):
+    summary = {"training": training_profiler.summary(), "workers": {}}
+    for worker_index in range(num_workers):
+        worker_summary_file = os.path.join(get_output_dir(worker_index, num_workers, output_root), f"profile_worker_{worker_index}.json")
+        if os.path.exists(worker_summary_file):
+            with open(worker_summary_file, "r") as f:
+                summary["workers"][worker_index] = json.load(f)
+    summary_file = os.path.join(output_root, "profile_summary.json")
+    with open(summary_file, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Profile summary saved as {summary_file}")
+    for worker_index, worker_summary in summary["workers"].items():
+        for section, section_summary in worker_summary["sections"].items():
+            print(f"Worker {worker_index} {section}: p50 {section_summary['p50']:.4f}, p90 {section_summary['p90']:.4f}, p99 {section_summary['p99']:.4f} ({section_summary['count']} samples)")
+
+# Function to save a model without ever leaving a partly written file in place of the last checkpoint
+def save_model(model, model_path):
+    temporary_path = os.path.splitext(model_path)[0] + ".tmp.zip"
+    model.save(temporary_path)
+    os.replace(temporary_path, model_path)
+
+# Callback saving the model and the state of every worker each checkpoint_interval timesteps and at the
+# end of training, and stopping training once the deadline of the time budget has passed
+class CheckpointCallback(BaseCallback):
+    def __init__(self, model_path, checkpoint_interval=checkpoint_interval, deadline=None, verbose=0):
+        super(CheckpointCallback, self).__init__(verbose)
+        self.model_path = model_path
+        self.checkpoint_interval = checkpoint_interval
+        self.deadline = deadline
+        self.last_checkpoint = 0
+
+    def _on_training_start(self):
+        self.last_checkpoint = self.num_timesteps
+
+    def _on_step(self):
+        if self.num_timesteps - self.last_checkpoint >= self.checkpoint_interval:
+            self.save()
+        if self.deadline is not None and time.time() >= self.deadline:
+            print(f"Time budget used up after {self.num_timesteps} timesteps, stopping training")
+            return False
+        return True
+
+    def _on_training_end(self):
+        self.save()
+
+    def save(self):
+        self.training_env.env_method("save_state")
+        save_model(self.model, self.model_path)
+        self.last_checkpoint = self.num_timesteps
+        print(f"Saved checkpoint at {self.num_timesteps} timesteps as {self.model_path}")
+
+# Function to read option values from a JSON config file, keyed by option name (e.g. "time_budget" or "time-budget")
+def read_config(path, parser):
+    with open(path, "r") as f:
+        config = json.load(f)
+    known_options = vars(parser.parse_args([]))
+    options = {}
+    for key, value in config.items():
+        option = key.replace("-", "_")
+        if option not in known_options or option == "config":
+            parser.error(f"Unknown option in {path}: {key}")
+        options[option] = value
+    return options
+
+# Function to give every worker its own output subdirectory so generated files never collide
+def get_output_dir(worker_index, num_workers, output_root=subfolder):
+    return output_root if num_workers == 1 else os.path.join(output_root, f"worker_{worker_index}")
+
+# Function to build a WebAppEnv factory; the factory runs inside the worker process
+def make_env(web_app_url, worker_index, num_workers, llm_batch_size, use_llm=True, settle_timeout=10.0, quiet_window=0.25, error_patterns=default_error_patterns, lean_profile=None, profile=False, headless=True, output_root=subfolder, stall_steps=300, episode_time_budget=600.0, session_checkpoints=20):
+    def _init():
+        output_dir = get_output_dir(worker_index, num_workers, output_root)
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        # Without the LLM, fields get cached answers from earlier runs or rule-based values
+        value_generator = SampleValueGenerator(LlamaCache(llama_cache_file, llama_cache_max_entries), load_llama if use_llm else None, llm_batch_size)
+        coverage = CoverageIndex(coverage_file, new_state_reward, new_transition_reward)
+        error_index = ErrorIndex(error_index_file, max_saved_error_occurrences)
+        driver = create_driver(worker_index, lean_profile, headless)
+        install_error_hook(driver, error_patterns)
+        wait_policy = WaitPolicy(settle_timeout, quiet_window)
+        wait_policy.install(driver)
+        profiler = NullProfiler()
+        if profile:
+            # Count the WebDriver commands of every step and write the step timings to TensorBoard
+            profiler = StepProfiler(os.path.join(tensorboard_log_dir, f"profile_worker_{worker_index}"))
+            profiler.instrument(driver)
+        scheduler = EpisodeScheduler(stall_steps, episode_time_budget)
+        session_store = SessionStore(session_checkpoints)
+        return WebAppEnv(driver, value_generator, coverage, error_index, web_app_url, output_dir, worker_index, wait_policy, profiler, scheduler, session_store)
+    return _init
+
+def main():
+    parser = argparse.ArgumentParser(description="Explore a web application with a PPO agent")
+    parser.add_argument("--config", default=None, help="JSON file with option values, such as {\"url\": \"https://localhost:7282/\", \"workers\": 4}; options given on the command line take precedence")
+    parser.add_argument("--url", default=None, help="URL of the web application; asked for when not given")
+    parser.add_argument("--total-timesteps", type=int, default=max_episodes * max_steps, help="Number of timesteps the model is trained for in total, across resumed runs")
+    parser.add_argument("--time-budget", type=float, default=None, help="Minutes the whole run may take; training stops when they are used up and testing stops at the end of them")
+    parser.add_argument("--test-episodes", type=int, default=max_episodes, help="Number of episodes run with the trained model after training; 0 skips testing")
+    parser.add_argument("--stall-steps", type=int, default=300, help="End an episode after this many steps without reaching a state not seen earlier in it; 0 disables")
+    parser.add_argument("--episode-time-budget", type=float, default=10.0, help="Minutes an episode may run before it is ended; 0 disables")
+    parser.add_argument("--session-checkpoints", type=int, default=20, help="Number of browser sessions (cookies and storage) saved per worker at new states and restored on reset; 0 disables")
+    parser.add_argument("--checkpoint-interval", type=int, default=checkpoint_interval, help="Timesteps between checkpoints of the model, the coverage index and the LLM cache")
+    parser.add_argument("--no-resume", action="store_true", help="Start a new model instead of resuming from the last checkpoint")
+    parser.add_argument("--headless", dest="headless", action="store_true", default=True, help="Run the browsers headless (default)")
+    parser.add_argument("--no-headless", dest="headless", action="store_false", help="Show the browser windows")
+    parser.add_argument("--output-dir", default=subfolder, help="Folder for traces, generated scripts, error logs and reports")
+    parser.add_argument("--model-dir", default=model_dir, help="Folder for the trained model and its checkpoints")
+    parser.add_argument("--workers", type=int, default=1, help="Number of isolated headless Chrome workers to run in parallel")
+    parser.add_argument("--llm-batch-size", type=int, default=8, help="Number of uncached fields asked for in one LLM prompt; 1 asks for each field separately")
+    parser.add_argument("--no-llm", action="store_true", help="Never load the LLM; fill fields with cached or rule-based values")
+    parser.add_argument("--settle-timeout", type=float, default=10.0, help="Maximum seconds to wait for the page to settle after each action; 0 disables waiting")
+    parser.add_argument("--quiet-window", type=float, default=0.25, help="Seconds without requests or DOM changes before the page counts as settled")
+    parser.add_argument("--error-pattern", action="append", default=None, help="Regular expression for page text that counts as an error (repeatable; default: \"unhandled exception\")")
+    parser.add_argument("--lean", action="store_true", help="Block images, fonts, media and trackers, disable animations, cap the window size and keep a disk cache per worker")
+    parser.add_argument("--block-resource", action="append", choices=sorted(resource_type_patterns), default=None, help="Resource type blocked by --lean (repeatable; default: image, font and media)")
+    parser.add_argument("--block-url", action="append", default=None, help="URL pattern blocked by --lean, with * wildcards (repeatable; default: common trackers)")
+    parser.add_argument("--profile", action="store_true", help="Time every part of each step and the PPO updates, and write percentiles to TensorBoard and profile_summary.json")
+
+    # Values from the config file replace the defaults, and options on the command line replace both
+    args, _ = parser.parse_known_args()
+    if args.config:
+        parser.set_defaults(**read_config(args.config, parser))
+    args = parser.parse_args()
+    deadline = time.time() + args.time_budget * 60 if args.time_budget is not None else None
+
+    lean_profile = None
+    if args.lean:
+        lean_profile = LeanProfile(args.block_resource or ("image", "font", "media"), args.block_url or default_blocked_url_patterns)
+
+    # Terminate existing chromedriver.exe processes before starting
+    terminate_chromedriver_processes()
+
+    # Download the model up front so parallel workers never download it at the same time;
+    # each worker only loads it on its first cache miss
+    if not args.no_llm:
+        download_model()
+
+    # Accept the web application URL as user input unless it was given
+    web_app_url = args.url or input("Enter the web application URL: ")
+
+    # Create the subfolder for generated scripts and the /models directory
+    for directory in (args.output_dir, args.model_dir):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    try:
+        # Define the model path
+        model_path = os.path.join(args.model_dir, "ppo_web_app_model.zip")
+
+        # Create the environment, running each worker in its own process when more than one is requested
+        env_fns = [make_env(web_app_url, worker_index, args.workers, args.llm_batch_size, not args.no_llm, args.settle_timeout, args.quiet_window, args.error_pattern or default_error_patterns, lean_profile, args.profile, args.headless, args.output_dir, args.stall_steps, args.episode_time_budget * 60, args.session_checkpoints) for worker_index in range(args.workers)]
+        if args.workers > 1:
+            env = SubprocVecEnv(env_fns)
+        else:
+            env = DummyVecEnv(env_fns)
+
+        # Create or load the model
+        model = None
+        if os.path.exists(model_path) and not args.no_resume:
+            try:
+                # Load the pre-trained reinforcement learning model, which also holds the timesteps it was trained for
+                model = PPO.load(model_path, env=env)
+                print(f"Resuming from {model_path} after {model.num_timesteps} timesteps")
+            except ValueError as e:
+                # Models trained with a different observation layout cannot be reused
+                print(f"Unable to reuse {model_path}, training a new model: {e}")
+        if model is None:
+            model = PPO("MlpPolicy", env, verbose=1, tensorboard_log=tensorboard_log_dir)
+
+        # Train a Proximal Policy Optimization (PPO) agent for the timesteps left, saving checkpoints as it goes
+        training_profiler = NullProfiler()
+        remaining_timesteps = args.total_timesteps - model.num_timesteps
+        if remaining_timesteps > 0:
+            print(f"Training the model for {remaining_timesteps} timesteps")
+            callbacks = [CheckpointCallback(model_path, args.checkpoint_interval, deadline)]
+            if args.profile:
+                training_profiler = StepProfiler(os.path.join(tensorboard_log_dir, "profile_training"), report_interval=1)
+                callbacks.append(ProfilingCallback(training_profiler))
+            model.learn(total_timesteps=remaining_timesteps, callback=callbacks, reset_num_timesteps=False)
+            training_profiler.close()
+        else:
+            print(f"The model has already been trained for {model.num_timesteps} timesteps")
+
+        # Test the trained agent; episodes finish independently in each worker
+        episodes_completed = 0
         obs = env.reset()
-        total_reward = 0
+        total_rewards = np.zeros(env.num_envs)
 
-        for step in range(max_steps):
+        while episodes_completed < args.test_episodes:
+            if deadline is not None and time.time() >= deadline:
+                print(f"Time budget used up after {episodes_completed} test episodes")
+                break
             action, _ = model.predict(obs)
-            obs, reward, done, _ = env.step(action)
-            total_reward += reward
-
-            if done:
-                print(f"Total Reward: {total_reward}")
-                break  # Add this line to exit the episode loop when done
-
-        if episode + 1 == max_episodes:
-            break  # Add this line to exit the episode loop when max_episodes is reached
-
-    # Save the llama cache to JSON file
-    with open(llama_cache_file, "w") as f:
-        json.dump(llama_cache, f)
-
-    # Close the environment
-    env.close()
-except Exception as e:
-    print(f"Exception encountered: {e}")
-    terminate_chromedriver_processes()
\ No newline at end of file
+            obs, rewards, dones, _ = env.step(action)
+            total_rewards += rewards
+
+            for worker_index in np.flatnonzero(dones):
+                episodes_completed += 1
+                print(f"Episode {episodes_completed}/{args.test_episodes}")
+                print(f"Total Reward: {total_rewards[worker_index]}")
+                total_rewards[worker_index] = 0
+
+        # Report how fast the workers discovered states no worker had seen before
+        episode_stats = env.env_method("episode_stats")
+        print(f"Discovered {sum(stats['new_states'] for stats in episode_stats)} new states, "
+              f"{sum(stats['states_per_minute'] for stats in episode_stats):.2f} per minute across {len(episode_stats)} workers; "
+              f"{sum(stats['stalled_episodes'] + stats['timed_out_episodes'] for stats in episode_stats)} of {sum(stats['episodes'] for stats in episode_stats)} episodes ended early")
+
+        # Close the environment
+        env.close()
+
+        # Combine the profiles of the workers and of training into one summary
+        if args.profile:
+            write_profile_summary(training_profiler, args.workers, args.output_dir)
+
+        # Export the navigation graph recorded so far to visualize coverage
+        coverage = CoverageIndex(coverage_file)
+        for graph_file in ("coverage_graph.json", "coverage_graph.graphml"):
+            coverage.export_graph(os.path.join(args.output_dir, graph_file))
+        coverage.close()
+
+        # Summarize the unique errors found so far with their counts and shortest traces
+        error_index = ErrorIndex(error_index_file)
+        report = error_index.export_report(os.path.join(args.output_dir, "error_report.json"))
+        print(f"Found {len(report)} unique errors in {sum(error['occurrences'] for error in report)} occurrences")
+        error_index.close()
+    except Exception as e:
+        print(f"Exception encountered: {e}")
+        terminate_chromedriver_processes()
+        # Let scheduled jobs see that the run failed
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# Trace minimization: shrink a trace that triggers an error to the shortest sequence of actions
+# that still reproduces the same console error, using delta debugging (ddmin) on the replay path
+
+import argparse
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from Browser import LeanProfile, WaitPolicy
+from Errors import has_error_signature, normalize_error_message, read_error_log
+from Replay import compile_records, create_driver, default_workers, execute_actions, get_logs, read_records, reset_driver, script_timeout, start_url
+from Trace import export_scripts, write_trace
+
+# Pool of reusable browsers for testing candidate traces in parallel.
+# Browsers are created on first use and reset between candidates instead of being relaunched.
+class BrowserPool:
+    def __init__(self, size, wait_policy=None, lean_profile=None, timeout=script_timeout):
+        self.size = size
+        self.timeout = timeout
+        self.wait_policy = wait_policy
+        self.lean_profile = lean_profile
+        self.slots = queue.Queue()
+        for worker_index in range(size):
+            self.slots.put([worker_index, None])
+        self.drivers = []
+        self.lock = threading.Lock()
+
+    # Function to run a function with a clean browser of the pool
+    def run(self, function, url):
+        slot = self.slots.get()
+        try:
+            worker_index, driver = slot
+            if driver is None:
+                driver = create_driver(worker_index, self.wait_policy, self.lean_profile, self.timeout)
+                slot[1] = driver
+                with self.lock:
+                    self.drivers.append(driver)
+            else:
+                reset_driver(driver, url)
+            return function(driver)
+        except Exception:
+            # A browser that failed may be unusable, so the slot gets a new one next time
+            if slot[1] is not None:
+                with self.lock:
+                    self.drivers.remove(slot[1])
+                try:
+                    slot[1].quit()
+                except Exception:
+                    pass
+                slot[1] = None
+            raise
+        finally:
+            self.slots.put(slot)
+
+    def close(self):
+        for driver in self.drivers:
+            driver.quit()
+        self.drivers = []
+
+# Delta debugging over the actions of a trace.
+# A candidate is a tuple of indices into the recorded actions, in their original order. Every tested
+# candidate is cached, and candidates are tested in parallel batches of the pool size; the first
+# batch with a reproducing candidate ends the round, keeping the earliest of them.
+class TraceMinimizer:
+    def __init__(self, records, signature, pool, url, timeout=script_timeout, max_tests=None):
+        self.records = records
+        self.signature = signature
+        self.pool = pool
+        self.url = url
+        self.timeout = timeout
+        self.max_tests = max_tests
+        self.cache = {}
+        self.tests = 0
+        self.cache_hits = 0
+
+    # Function to replay the actions of a candidate and return the error messages it produced
+    def replay(self, candidate):
+        compiled_actions = compile_records([self.records[index] for index in candidate])
+
+        def run(driver):
+            driver.get(self.url)
+            execute_actions(compiled_actions, driver, "candidate", self.timeout, self.pool.wait_policy)
+            return [log['message'] for log in get_logs(driver) if log['level'] in ('SEVERE', 'ERROR', 'error', 'rejection', 'console', 'text')]
+        return self.pool.run(run, self.url)
+
+    # Function to check whether a candidate reproduces the error; a candidate that could not be run does not
+    def reproduces(self, candidate):
+        try:
+            return has_error_signature(self.replay(candidate), self.signature)
+        except Exception as e:
+            print(f"Candidate of {len(candidate)} actions could not be replayed: {e}")
+            return False
+
+    # Function to test candidates in parallel, returning the first one that reproduces the error
+    def find_reproducing(self, candidates):
+        for candidate in candidates:
+            if candidate in self.cache:
+                self.cache_hits += 1
+                if self.cache[candidate]:
+                    return candidate
+
+        untested = [candidate for candidate in dict.fromkeys(candidates) if candidate not in self.cache]
+        with ThreadPoolExecutor(max_workers=self.pool.size) as executor:
+            for batch_start in range(0, len(untested), self.pool.size):
+                if self.max_tests is not None and self.tests >= self.max_tests:
+                    break
+                batch = untested[batch_start:batch_start + self.pool.size]
+                for candidate, result in zip(batch, executor.map(self.reproduces, batch)):
+                    self.cache[candidate] = result
+                    self.tests += 1
+                for candidate in batch:
+                    if self.cache[candidate]:
+                        return candidate
+        return None
+
+    def minimize(self):
+        candidate = tuple(range(len(self.records)))
+        granularity = 2
+        while len(candidate) >= 2:
+            if self.max_tests is not None and self.tests >= self.max_tests:
+                print(f"Stopping after {self.tests} tests")
+                break
+
+            # Split the candidate into chunks and test each chunk, then each complement
+            chunk_size = len(candidate) / granularity
+            chunks = [candidate[int(i * chunk_size):int((i + 1) * chunk_size)] for i in range(granularity)]
+            complements = [candidate[:int(i * chunk_size)] + candidate[int((i + 1) * chunk_size):] for i in range(granularity)]
+            subsets = [chunk for chunk in chunks if chunk]
+            reduced = self.find_reproducing(subsets + (complements if granularity > 2 else []))
+
+            if reduced is not None:
+                print(f"Reduced the trace from {len(candidate)} to {len(reduced)} actions")
+                granularity = 2 if reduced in subsets else max(granularity - 1, 2)
+                candidate = reduced
+            elif granularity >= len(candidate):
+                break
+            else:
+                granularity = min(granularity * 2, len(candidate))
+        return candidate
+
+# Function to pick the start page of a trace: its first navigation, or the default replay page
+def get_start_url(records):
+    for record in records:
+        if record["action"] == "navigate":
+            return record["value"]
+    return start_url
+
+# Function to derive the minimized trace path, Trace_<id>_min.jsonl next to the original
+def get_minimized_path(script_file_path):
+    directory, filename = os.path.split(script_file_path)
+    name = os.path.splitext(filename)[0]
+    if name.startswith("Steps_"):
+        name = "Trace_" + name[len("Steps_"):]
+    return os.path.join(directory, f"{name}_min.jsonl")
+
+def main():
+    parser = argparse.ArgumentParser(description="Shrink a trace to the shortest sequence of actions that reproduces its console error")
+    parser.add_argument("trace", help="Trace_*.jsonl (or Steps_*.py) file to minimize")
+    parser.add_argument("--error-log", default=None, help="Error_*.log file whose first console error should be reproduced")
+    parser.add_argument("--signature", default=None, help="Error message to reproduce, matched after normalization")
+    parser.add_argument("--workers", type=int, default=default_workers, help="Number of browsers testing candidates in parallel")
+    parser.add_argument("--timeout", type=float, default=script_timeout, help="Maximum time in seconds for replaying one candidate")
+    parser.add_argument("--max-tests", type=int, default=None, help="Stop after this many replays")
+    parser.add_argument("--settle-timeout", type=float, default=10.0, help="Maximum seconds to wait for the page to settle after each action; 0 disables waiting")
+    parser.add_argument("--quiet-window", type=float, default=0.25, help="Seconds without requests or DOM changes before the page counts as settled")
+    parser.add_argument("--lean", action="store_true", help="Block images, fonts, media and trackers, disable animations, cap the window size and keep a disk cache per browser")
+    args = parser.parse_args()
+
+    records = read_records(args.trace)
+    compile_records(records, args.trace)  # Validate the whole trace before starting any browser
+    url = get_start_url(records)
+
+    pool = BrowserPool(args.workers, WaitPolicy(args.settle_timeout, args.quiet_window), LeanProfile() if args.lean else None, args.timeout)
+    try:
+        minimizer = TraceMinimizer(records, None, pool, url, args.timeout, args.max_tests)
+        full_trace = tuple(range(len(records)))
+
+        # Take the error to reproduce from the arguments, or from a replay of the whole trace
+        if args.signature:
+            signature = normalize_error_message(args.signature)
+        elif args.error_log:
+            messages = read_error_log(args.error_log)
+            if not messages:
+                print(f"No console errors found in {args.error_log}")
+                return
+            signature = normalize_error_message(messages[0])
+        else:
+            messages = minimizer.replay(full_trace)
+            if not messages:
+                print(f"Replaying {args.trace} produced no console errors")
+                return
+            signature = normalize_error_message(messages[0])
+        minimizer.signature = signature
+        print(f"Error signature: {signature}")
+
+        start_time = time.perf_counter()
+        if not minimizer.reproduces(full_trace):
+            print("The complete trace does not reproduce the error")
+            return
+        minimizer.cache[full_trace] = True
+        minimizer.tests += 1
+
+        minimized = minimizer.minimize()
+        minimized_path = get_minimized_path(args.trace)
+        write_trace(minimized_path, [records[index] for index in minimized])
+        selenium_steps_file, uft_steps_file = export_scripts(minimized_path)
+
+        print(f"Minimized {len(records)} actions to {len(minimized)} in {time.perf_counter() - start_time:.1f}s "
+              f"({minimizer.tests} replays, {minimizer.cache_hits} cache hits)")
+        print(f"Minimized trace saved as {minimized_path}")
+        print(f"Generated {selenium_steps_file} and {uft_steps_file}")
+    finally:
+        pool.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# Per-step latency instrumentation for the exploration loop
+
+import json
+import random
+import time
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+
+# Define the percentiles reported for every timed section
+percentiles = [50, 90, 99]
+
+# Define how many samples of each section are kept for the end of run summary
+max_summary_samples = 10000
+
+# Context manager adding the time spent inside it to a section of a profiler
+class SectionTimer:
+    def __init__(self, profiler, section):
+        self.profiler = profiler
+        self.section = section
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.add(self.section, time.perf_counter() - self.start_time)
+        return False
+
+# Collects timings (in seconds) and counts per section, such as element discovery or the action itself.
+# Every report_interval steps the percentiles and histograms of the last interval are written to
+# TensorBoard, and summary() describes the whole run from a bounded random sample of each section.
+class StepProfiler:
+    enabled = True
+
+    def __init__(self, log_dir=None, report_interval=100):
+        self.report_interval = report_interval
+        self.steps = 0
+        self.step_commands = 0
+        self.interval_samples = {}
+        self.summary_samples = {}
+        self.counts = {}
+        self.totals = {}
+        self.maximums = {}
+        self.writer = None
+        if log_dir is not None:
+            from torch.utils.tensorboard import SummaryWriter
+            self.writer = SummaryWriter(log_dir=log_dir)
+
+    def measure(self, section):
+        return SectionTimer(self, section)
+
+    def add(self, section, value):
+        self.interval_samples.setdefault(section, []).append(value)
+        count = self.counts.get(section, 0) + 1
+        self.counts[section] = count
+        self.totals[section] = self.totals.get(section, 0.0) + value
+        self.maximums[section] = max(self.maximums.get(section, value), value)
+
+        # Reservoir sampling keeps an unbiased sample of every section in bounded memory
+        samples = self.summary_samples.setdefault(section, [])
+        if len(samples) < max_summary_samples:
+            samples.append(value)
+        else:
+            index = random.randrange(count)
+            if index < max_summary_samples:
+                samples[index] = value
+
+    # Function to count every WebDriver command the driver sends from now on
+    def instrument(self, driver):
+        execute = driver.execute
+
+        def counted_execute(driver_command, params=None):
+            self.step_commands += 1
+            return execute(driver_command, params)
+        driver.execute = counted_execute
+
+    def end_step(self):
+        self.add("webdriver_commands", self.step_commands)
+        self.step_commands = 0
+        self.advance()
+
+    # Function to count a step (or a policy update) and report every report_interval of them
+    def advance(self):
+        self.steps += 1
+        if self.steps % self.report_interval == 0:
+            self.report()
+
+    # Function to write the percentiles and histograms of the last interval to TensorBoard
+    def report(self):
+        if self.writer is not None:
+            for section, samples in self.interval_samples.items():
+                values = np.array(samples)
+                for percentile, value in zip(percentiles, np.percentile(values, percentiles)):
+                    self.writer.add_scalar(f"profile/{section}_p{percentile}", value, self.steps)
+                self.writer.add_histogram(f"profile/{section}", values, self.steps)
+            self.writer.flush()
+        self.interval_samples = {}
+
+    def summary(self):
+        summary = {"steps": self.steps, "sections": {}}
+        for section, samples in self.summary_samples.items():
+            values = np.array(samples)
+            section_summary = {
+                "count": self.counts[section],
+                "total": round(self.totals[section], 4),
+                "mean": round(self.totals[section] / self.counts[section], 6),
+                "max": round(self.maximums[section], 6)
+            }
+            for percentile, value in zip(percentiles, np.percentile(values, percentiles)):
+                section_summary[f"p{percentile}"] = round(float(value), 6)
+            summary["sections"][section] = section_summary
+        return summary
+
+    def write_summary(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def close(self):
+        self.report()
+        if self.writer is not None:
+            self.writer.close()
+
+# Stand-in used when profiling is off, so instrumented code costs next to nothing
+class NullProfiler:
+    enabled = False
+
+    class NullTimer:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            return False
+
+    null_timer = NullTimer()
+
+    def measure(self, section):
+        return self.null_timer
+
+    def add(self, section, value):
+        pass
+
+    def instrument(self, driver):
+        pass
+
+    def end_step(self):
+        pass
+
+    def advance(self):
+        pass
+
+    def summary(self):
+        return {}
+
+    def write_summary(self, path):
+        pass
+
+    def close(self):
+        pass
+
+# Callback timing PPO rollouts and the policy updates between them
+class ProfilingCallback(BaseCallback):
+    def __init__(self, profiler, verbose=0):
+        super(ProfilingCallback, self).__init__(verbose)
+        self.profiler = profiler
+        self.rollout_start = None
+        self.update_start = None
+
+    def _on_rollout_start(self):
+        now = time.perf_counter()
+        if self.update_start is not None:
+            self.profiler.add("ppo_update", now - self.update_start)
+            self.profiler.advance()
+        self.rollout_start = now
+
+    def _on_rollout_end(self):
+        now = time.perf_counter()
+        self.profiler.add("rollout", now - self.rollout_start)
+        self.update_start = now
+
+    def _on_step(self):
+        return True
+
+    def _on_training_end(self):
+        if self.update_start is not None:
+            self.profiler.add("ppo_update", time.perf_counter() - self.update_start)
+            self.profiler.advance()
+            self.update_start = None
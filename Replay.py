@@ -1,98 +1,349 @@
+import argparse
+import json
 import os
+import queue
+import threading
 import time
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import Select
 from selenium.webdriver.chrome.service import Service
+from Browser import LeanProfile, WaitPolicy, clear_browser_state, drain_page_errors, install_error_hook
+from Trace import read_script, read_trace, validate_record
 
 # Set the path to chromedriver.exe in the current directory
 chromedriver_path = os.path.join(os.getcwd(), "chromedriver.exe")
 
-# Define the folder path containing the generated Selenium steps scripts
+# Define the folder path containing the traces and generated Selenium steps scripts
 folder_path = "./generated-scripts"
 
-# Function to execute a Selenium steps script
-def execute_script(script_file_path, driver):
-    with open(script_file_path, "r") as script_file:
-        for line in script_file:
-            try:
-                # Add an explicit wait for the page to load
-                # WebDriverWait(driver, 2).until(EC.presence_of_element_located((By.XPATH, 'your_element_locator_here')))
-                exec(line, globals(), locals())
-            except Exception as e:
-                print(f"Error executing script line in {script_file_path}: {line}")
-                print(f"Error message: {e}")
-
-# Function to check for JavaScript errors in the console logs
-def check_for_js_errors(driver):
+# Define the page opened before each script and the first remote debugging port of the browser pool
+start_url = "https://localhost:7282/"
+remote_debugging_port = 9222
+
+# Define the default number of browsers and the time a single script may take, in seconds
+default_workers = os.cpu_count() or 1
+script_timeout = 300
+
+# Function to collect the traces to replay, including those in parallel worker subfolders.
+# Steps scripts are only replayed when there is no trace they were generated from.
+def find_scripts(folder_path):
+    script_file_paths = []
+    for root, _, filenames in os.walk(folder_path):
+        trace_ids = {filename[len("Trace_"):-len(".jsonl")] for filename in filenames if filename.startswith("Trace_") and filename.endswith(".jsonl")}
+        for filename in sorted(filenames):
+            if filename.startswith("Trace_") and filename.endswith(".jsonl"):
+                script_file_paths.append(os.path.join(root, filename))
+            elif filename.startswith("Steps_") and filename.endswith(".py") and filename[len("Steps_"):-len(".py")] not in trace_ids:
+                script_file_paths.append(os.path.join(root, filename))
+    return script_file_paths
+
+# Function to create the browser of one slot in the pool, each on its own remote debugging port
+def create_driver(worker_index=0, wait_policy=None, lean_profile=None, timeout=script_timeout):
+    # Every browser needs its own chromedriver process, so the service is not shared
+    chrome_service = Service(executable_path=chromedriver_path)
+
+    chrome_options = webdriver.ChromeOptions()
+    chrome_options.add_argument("--disable-infobars")
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument(f"--remote-debugging-port={remote_debugging_port + worker_index}")
+    if lean_profile is not None:
+        lean_profile.add_arguments(chrome_options, f"replay_{worker_index}")
+    else:
+        chrome_options.add_argument("--start-maximized")
+    chrome_options.add_argument("--disable-notifications")
+    chrome_options.add_argument("--ignore-certificate-errors")
+    chrome_options.add_argument("--disable-popup-blocking")
+    chrome_options.add_argument("--disable-logging")  # Disable logging to console
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+
+    capabilities = DesiredCapabilities.CHROME.copy()
+    capabilities['goog:loggingPrefs'] = {'browser': 'ALL'}
+    # Leave alerts open for the accept and dismiss actions of the trace
+    capabilities['unhandledPromptBehavior'] = 'ignore'
+
+    driver = webdriver.Chrome(service=chrome_service, options=chrome_options, desired_capabilities=capabilities)
+    # A hung page load must not outlast the time allowed for a whole script
+    driver.set_page_load_timeout(timeout)
+    install_error_hook(driver)
+    if wait_policy is not None:
+        wait_policy.install(driver)
+    if lean_profile is not None:
+        lean_profile.install(driver)
+    return driver
+
+# Function to bring a reused browser back to a clean state instead of relaunching it
+def reset_driver(driver, url):
+    # Clear the cookies and storage of the start page and of the page the last script ended on
+    clear_browser_state(driver, [url, driver.current_url])
+    driver.get("about:blank")
+    # Drop console messages left over from the previous script
+    driver.get_log('browser')
+
+# Functions performing each action of a trace
+# Locators are recorded only when they match exactly one element, so more than one match means the page changed
+def find_element(driver, locator):
+    elements = driver.find_elements(By.XPATH, locator)
+    if len(elements) != 1:
+        raise LookupError(f"Locator matched {len(elements)} elements: {locator}")
+    return elements[0]
+
+def navigate(driver, locator, value):
+    driver.get(value)
+
+def click(driver, locator, value):
+    find_element(driver, locator).click()
+
+def set_text(driver, locator, value):
+    element = find_element(driver, locator)
+    element.clear()
+    element.send_keys(value)
+
+def enter_date(driver, locator, value):
+    find_element(driver, locator).send_keys(value)
+
+def select_value(driver, locator, value):
+    Select(find_element(driver, locator)).select_by_value(value)
+
+def scroll(driver, locator, value):
+    driver.execute_script("window.scrollBy(0, arguments[0]);", int(value))
+
+def accept_alert(driver, locator, value):
+    driver.switch_to.alert.accept()
+
+def dismiss_alert(driver, locator, value):
+    driver.switch_to.alert.dismiss()
+
+# Define the handler of each action type of a trace
+action_handlers = {
+    "navigate": navigate,
+    "click": click,
+    "input_text": set_text,
+    "scroll": scroll,
+    "select_option": select_value,
+    "enter_date": enter_date,
+    "select_radio": click,
+    "accept_alert": accept_alert,
+    "dismiss_alert": dismiss_alert
+}
+
+# Function to read the records of a trace, or of a steps script generated before traces existed
+def read_records(script_file_path):
+    if script_file_path.endswith(".jsonl"):
+        return read_trace(script_file_path)
+    return read_script(script_file_path)
+
+# Function to validate trace records and turn them into a list of (handler, locator, value) steps.
+# Raises ValueError for an invalid record.
+def compile_records(records, script_file_path=""):
+    compiled_actions = []
+    for step, record in enumerate(records):
+        try:
+            validate_record(record)
+        except ValueError as e:
+            raise ValueError(f"Step {step} of {script_file_path}: {e}")
+        compiled_actions.append((action_handlers[record["action"]], record.get("locator", ""), record.get("value", "")))
+    return compiled_actions
+
+# Function to parse and validate a trace once, before it is replayed
+def compile_script(script_file_path):
+    return compile_records(read_records(script_file_path), script_file_path)
+
+# Function to execute compiled actions, returning the number of actions that failed.
+# The timeout is checked between actions, and page loads are bounded by the driver's page load timeout.
+def execute_actions(compiled_actions, driver, script_file_path, timeout=script_timeout, wait_policy=None):
+    deadline = time.monotonic() + timeout
+    failed_actions = 0
+    for handler, locator, value in compiled_actions:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Script did not finish within {timeout} seconds")
+        try:
+            handler(driver, locator, value)
+            # Wait for the page to settle instead of firing the next action at a page that is still loading
+            if wait_policy is not None:
+                wait_policy.wait(driver)
+        except Exception as e:
+            failed_actions += 1
+            print(f"Error executing {handler.__name__} in {script_file_path}: {locator} {value}")
+            print(f"Error message: {e}")
+    return failed_actions
+
+# Function to return the JavaScript errors in the console logs and the errors collected in the page
+def get_js_errors(logs):
+    return [log for log in logs if (log['level'] == 'SEVERE' and 'Error' in log['message']) or log['level'] in ('error', 'rejection', 'text')]
+
+# Function to read the browser log together with the errors collected in the page
+def get_logs(driver):
     logs = driver.get_log('browser')
-    for log in logs:
-        if log['level'] == 'SEVERE' and 'Error' in log['message']:
-            return True
-    return False
-
-# Initialize the ChromeService
-chrome_service = Service(executable_path=chromedriver_path)
-
-# Initialize the Selenium WebDriver
-chrome_options = webdriver.ChromeOptions()
-chrome_options.add_argument("--disable-infobars")
-chrome_options.add_argument("--disable-extensions")
-chrome_options.add_argument("--disable-gpu")
-chrome_options.add_argument("--disable-dev-shm-usage")
-chrome_options.add_argument("--no-sandbox")
-chrome_options.add_argument("--remote-debugging-port=9222")
-chrome_options.add_argument("--start-maximized")
-chrome_options.add_argument("--disable-notifications")
-chrome_options.add_argument("--ignore-certificate-errors")
-chrome_options.add_argument("--disable-popup-blocking")
-chrome_options.add_argument("--disable-logging")  # Disable logging to consolezd
-chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-
-capabilities = DesiredCapabilities.CHROME
-capabilities['goog:loggingPrefs'] = {'browser': 'ALL'}
-
-# Iterate over all files in the folder and run scripts
-for filename in os.listdir(folder_path):
-    if filename.endswith(".py"):
-        script_file_path = os.path.join(folder_path, filename)
-        print(f"Executing script: {script_file_path}")
-
-        # Initialize the WebDriver using the service
-        driver = webdriver.Chrome(service=chrome_service, options=chrome_options, desired_capabilities=capabilities)
+    try:
+        logs += drain_page_errors(driver)
+    except Exception:
+        pass  # An open alert keeps the page from being read
+    return logs
+
+# Function to save a screenshot and the console output of a script that raised JavaScript errors
+def log_js_errors(driver, script_file_path, logs, output_dir):
+    current_url = driver.current_url
+    current_time = time.strftime("%Y%m%d%H%M%S")
+    escaped_url = current_url.replace("/", "_").replace(":", "_")
+    # The script name keeps files of scripts that fail at the same time in different browsers apart
+    script_name = os.path.splitext(os.path.basename(script_file_path))[0]
+
+    # Capture screenshot of the page
+    screenshot_file = os.path.join(output_dir, f"Error_{escaped_url}_{script_name}_{current_time}.png")
+    driver.save_screenshot(screenshot_file)
+    print(f"Screenshot saved as {screenshot_file}")
+
+    # Log console output
+    console_log_file = os.path.join(output_dir, f"Error_{escaped_url}_{script_name}_{current_time}.log")
+    with open(console_log_file, "w") as log_file:
+        for log in logs:
+            log_file.write(f"[{log['level']}] - {log['message']}\n")
+    print(f"Console output saved as {console_log_file}")
+    return screenshot_file, console_log_file
 
+# Function to replay one script on a browser of the pool and describe the outcome
+def replay_script(driver, script_file_path, compiled_actions, url, output_dir, timeout, wait_policy=None):
+    result = {"script": script_file_path, "status": "passed", "actions": len(compiled_actions), "failed_actions": 0, "js_errors": 0}
+    try:
+        # Open the page before executing scripts
+        driver.get(url)
+        result["failed_actions"] = execute_actions(compiled_actions, driver, script_file_path, timeout, wait_policy)
+
+        # Check for JavaScript errors in the console logs
+        logs = get_logs(driver)
+        js_errors = get_js_errors(logs)
+        if js_errors:
+            print(f"JavaScript Error Detected in {script_file_path}!")
+            result["status"] = "js_error"
+            result["js_errors"] = len(js_errors)
+            result["screenshot"], result["log"] = log_js_errors(driver, script_file_path, logs, output_dir)
+        elif result["failed_actions"]:
+            result["status"] = "failed"
+    except TimeoutError as e:
+        result["status"] = "timeout"
+        result["message"] = str(e)
+    except Exception as e:
+        print(f"Error during script execution: {e}")
+        result["status"] = "crashed"
+        result["message"] = str(e)
+    return result
+
+# Function run by each browser of the pool: take scripts from the queue until it is empty
+def replay_worker(worker_index, script_queue, results, results_lock, url, output_dir, timeout, wait_policy, lean_profile=None):
+    driver = None
+    while True:
         try:
-            # Open the page before executing scripts
-            driver.get('https://localhost:7282/')
-            execute_script(script_file_path, driver)
-
-            # Check for JavaScript errors in the console logs
-            if check_for_js_errors(driver):
-                print("JavaScript Error Detected!")
-                current_url = driver.current_url
-                current_time = time.strftime("%Y%m%d%H%M%S")
-                escaped_url = current_url.replace("/", "_").replace(":", "_")
-
-                # Capture screenshot of the page
-                screenshot_file = os.path.join(folder_path, f"Error_{escaped_url}_{current_time}.png")
-                driver.save_screenshot(screenshot_file)
-                print(f"Screenshot saved as {screenshot_file}")
-
-                # Get and log console output
-                logs = driver.get_log('browser')
-                console_log_file = os.path.join(folder_path, f"Error_{escaped_url}_{current_time}.log")
-                with open(console_log_file, "w") as log_file:
-                    for log in logs:
-                        log_file.write(f"[{log['level']}] - {log['message']}\n")
-                print(f"Console output saved as {console_log_file}")
+            script_file_path, compiled_actions = script_queue.get_nowait()
+        except queue.Empty:
+            break
 
+        print(f"[browser {worker_index}] Executing script: {script_file_path}")
+        start_time = time.perf_counter()
+        try:
+            if driver is None:
+                driver = create_driver(worker_index, wait_policy, lean_profile, timeout)
+            else:
+                reset_driver(driver, url)
+            result = replay_script(driver, script_file_path, compiled_actions, url, output_dir, timeout, wait_policy)
         except Exception as e:
-            print(f"Error during script execution: {e}")
+            print(f"[browser {worker_index}] Browser failed: {e}")
+            result = {"script": script_file_path, "status": "crashed", "actions": len(compiled_actions), "failed_actions": 0, "js_errors": 0, "message": str(e)}
+
+        # A browser that crashed or timed out may be unusable, so it is replaced for the next script
+        if result["status"] in ("crashed", "timeout") and driver is not None:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+            driver = None
+
+        result["worker"] = worker_index
+        result["duration"] = round(time.perf_counter() - start_time, 3)
+        with results_lock:
+            results.append(result)
+
+    if driver is not None:
+        driver.quit()
+
+# Function to replay scripts on a pool of reusable browsers and return the merged results
+def run_replays(script_file_paths, workers=default_workers, url=start_url, output_dir=folder_path, timeout=script_timeout, wait_policy=None, lean_profile=None):
+    results = []
+    results_lock = threading.Lock()
+
+    # Every script is parsed and validated once, before any browser is started
+    script_queue = queue.Queue()
+    for script_file_path in script_file_paths:
+        try:
+            script_queue.put((script_file_path, compile_script(script_file_path)))
+        except (ValueError, OSError) as e:
+            print(f"Skipping invalid script: {e}")
+            results.append({"script": script_file_path, "status": "invalid", "actions": 0, "failed_actions": 0, "js_errors": 0, "message": str(e)})
+
+    threads = [
+        threading.Thread(target=replay_worker, args=(worker_index, script_queue, results, results_lock, url, output_dir, timeout, wait_policy, lean_profile))
+        for worker_index in range(min(workers, script_queue.qsize()))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Report the scripts in their original order regardless of which browser finished first
+    order = {script_file_path: index for index, script_file_path in enumerate(script_file_paths)}
+    results.sort(key=lambda result: order[result["script"]])
+    return results
+
+# Function to write the merged report of a replay run and print its summary
+def write_report(results, report_file, wall_time, workers):
+    summary = {}
+    for result in results:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+
+    report = {
+        "scripts": len(results),
+        "workers": workers,
+        "wall_time": round(wall_time, 3),
+        "scripts_per_minute": round(len(results) / wall_time * 60, 2) if wall_time > 0 else 0.0,
+        "summary": summary,
+        "results": results
+    }
+    with open(report_file, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Replayed {len(results)} scripts with {workers} browsers in {wall_time:.1f}s: {summary}")
+    print(f"Replay report saved as {report_file}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the generated Selenium steps scripts")
+    parser.add_argument("--folder", default=folder_path, help="Folder containing the generated steps scripts")
+    parser.add_argument("--workers", type=int, default=default_workers, help="Number of browsers replaying scripts in parallel")
+    parser.add_argument("--url", default=start_url, help="Page opened before each script")
+    parser.add_argument("--timeout", type=float, default=script_timeout, help="Maximum time in seconds for a single script")
+    parser.add_argument("--settle-timeout", type=float, default=10.0, help="Maximum seconds to wait for the page to settle after each action; 0 disables waiting")
+    parser.add_argument("--quiet-window", type=float, default=0.25, help="Seconds without requests or DOM changes before the page counts as settled")
+    parser.add_argument("--lean", action="store_true", help="Block images, fonts, media and trackers, disable animations, cap the window size and keep a disk cache per browser")
+    parser.add_argument("--report", default=None, help="Replay report file (default: replay_report.json in the scripts folder)")
+    args = parser.parse_args()
+
+    script_file_paths = find_scripts(args.folder)
+    if not script_file_paths:
+        print(f"No scripts found in {args.folder}")
+        return
+
+    start_time = time.perf_counter()
+    wait_policy = WaitPolicy(args.settle_timeout, args.quiet_window)
+    lean_profile = LeanProfile() if args.lean else None
+    results = run_replays(script_file_paths, args.workers, args.url, args.folder, args.timeout, wait_policy, lean_profile)
+    wall_time = time.perf_counter() - start_time
 
-        finally:
-            driver.quit()  # Close the WebDriver for each script execution
+    report_file = args.report or os.path.join(args.folder, "replay_report.json")
+    write_report(results, report_file, wall_time, min(args.workers, len(script_file_paths)))
 
-# Stop the ChromeService
-chrome_service.stop()
+if __name__ == "__main__":
+    main()
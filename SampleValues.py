@@ -0,0 +1,438 @@
+# Sample value generation support for input elements, shared by the exploration workers
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Attributes that describe what kind of value a field expects. Everything else, such as generated
+# ids, framework classes or the current value, is ignored so equivalent fields share one answer.
+signature_attributes = ["type", "name", "placeholder", "label", "pattern", "min", "max", "maxlength", "autocomplete"]
+
+# Function to reduce a generated field name such as "ctl00$main$email_2" or "user[email]" to "email"
+def normalize_field_name(name):
+    segments = [segment for segment in re.split(r"[$:.\[\]]", name) if segment]
+    if segments:
+        name = segments[-1]
+    return " ".join(re.sub(r"[\d_\-]+", " ", name).split())
+
+# Function to reduce the raw attributes of a field to its normalized semantic signature
+def get_field_signature(attributes):
+    signature = {}
+    for attribute in signature_attributes:
+        value = " ".join(str(attributes.get(attribute) or "").split())
+        if attribute in ("type", "name", "placeholder", "label", "autocomplete"):
+            value = value.lower()
+        if attribute == "name":
+            value = normalize_field_name(value)
+        elif attribute == "label":
+            value = value.rstrip("*: ")
+        if value:
+            signature[attribute] = value
+    return signature
+
+# Function to build a stable cache key from the kind of value requested and a field signature
+def get_signature_key(kind, signature):
+    return hashlib.sha256(json.dumps({"kind": kind, "signature": signature}, sort_keys=True).encode("utf-8")).hexdigest()
+
+# Function to describe a field signature inside an LLM prompt
+def describe_field_signature(signature):
+    return ", ".join(f'{attribute}="{value}"' for attribute, value in signature.items())
+
+# Prompts used to ask the LLM for a sample value, by kind of value
+prompt_templates = {
+    "input_text": "What is a valid sample value I could use for an HTML input element with these attributes? Please respond ONLY with a valid sample value in double quotes AND NOTHING ELSE: {}",
+    "enter_date": "What is a valid sample date I could use for an HTML input element with these attributes? Please respond ONLY with the valid sample value in double quotes and NOTHING ELSE: {}"
+}
+
+# Function to build the chat messages asking for a sample value for a field signature
+def build_messages(kind, signature):
+    return [{"role": "system", "content": prompt_templates[kind].format(describe_field_signature(signature))}]
+
+# Function to build the chat messages asking for sample values for several fields at once
+def build_batch_messages(fields):
+    lines = []
+    for field_id, kind, signature in fields:
+        value_kind = "date" if kind == "enter_date" else "value"
+        lines.append(f"{field_id}: a valid sample {value_kind} for an HTML input element with these attributes: {describe_field_signature(signature)}")
+    content = "What are valid sample values I could use for the following HTML input elements? Please respond ONLY with a JSON object that maps each field id to its sample value as a string AND NOTHING ELSE:\n" + "\n".join(lines)
+    return [{"role": "system", "content": content}]
+
+# Function to build a grammar that only accepts a JSON object with exactly the given field ids and string values
+def build_batch_grammar(field_ids):
+    members = ' "," ws '.join(f'"\\"{field_id}\\"" ws ":" ws string' for field_id in field_ids)
+    grammar = (
+        f'root ::= "{{" ws {members} ws "}}"\n'
+        r'string ::= "\"" ( [^"\\\x7F\x00-\x1F] | "\\" ["\\/bfnrt] )* "\""' "\n"
+        r'ws ::= [ \t\n]?' "\n"
+    )
+    from llama_cpp import LlamaGrammar
+    return LlamaGrammar.from_string(grammar, verbose=False)
+
+# Sample values for common kinds of fields, matched against the field type, name, label and placeholder
+heuristic_values = [
+    (("email", "e-mail"), "test.user@example.com"),
+    (("password", "passwd"), "Passw0rd!23"),
+    (("phone", "tel", "mobile"), "555-0100"),
+    (("url", "website", "homepage"), "https://example.com"),
+    (("zip", "postal", "postcode"), "12345"),
+    (("first",), "Alex"),
+    (("last", "surname"), "Smith"),
+    (("user",), "testuser"),
+    (("name",), "Alex Smith"),
+    (("street", "address"), "123 Main Street"),
+    (("city", "town"), "Springfield"),
+    (("state", "province", "region"), "CA"),
+    (("country",), "United States"),
+    (("company", "organization", "organisation"), "Example Inc"),
+    (("search", "query"), "test"),
+    (("age", "quantity", "qty", "amount", "number", "count"), "1")
+]
+
+# Function to produce a cheap rule-based sample value for a field signature
+def get_heuristic_value(kind, signature):
+    if kind == "enter_date" or signature.get("type") == "date":
+        value = datetime.date.today().isoformat()
+        # Stay within the allowed range when the field declares one
+        if signature.get("min") and value < signature["min"]:
+            value = signature["min"]
+        if signature.get("max") and value > signature["max"]:
+            value = signature["max"]
+        return value
+
+    if signature.get("type") == "number" and signature.get("min"):
+        return signature["min"]
+
+    description = " ".join(signature.get(attribute, "") for attribute in ("type", "name", "label", "placeholder", "autocomplete"))
+    value = "test"
+    for keywords, sample_value in heuristic_values:
+        # Short keywords must start a word so that e.g. "age" does not match "message"
+        if any(keyword in description if len(keyword) > 4 else re.search(r"\b" + re.escape(keyword), description) for keyword in keywords):
+            value = sample_value
+            break
+
+    if signature.get("maxlength", "").isdigit():
+        value = value[:int(signature["maxlength"])]
+    return value
+
+# Persistent cache of LLM responses stored in SQLite.
+# Entries are keyed by a stable hash such as get_signature_key, written as soon as they are
+# created, and evicted least-recently-used first once the cache grows past max_entries.
+# SQLite's own locking makes it safe for several worker processes to share one cache file, and
+# a lock makes it safe to use from the background generation thread of a worker.
+class LlamaCache:
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS llama_cache ("
+            "key TEXT PRIMARY KEY, prompt TEXT NOT NULL, response TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS llama_cache_last_used ON llama_cache (last_used)")
+        self.connection.commit()
+
+    # Function to look up a response, returning None on a miss
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT response FROM llama_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            # Refresh the entry so it is evicted last
+            with self.connection:
+                self.connection.execute("UPDATE llama_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    # Function to count a lookup answered without reading the cache because the key is not in it yet
+    def record_miss(self):
+        with self.lock:
+            self.misses += 1
+
+    # Function to check for a response without counting a lookup or refreshing the entry
+    def contains(self, key):
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM llama_cache WHERE key = ?", (key,)).fetchone() is not None
+
+    # Function to store a response immediately so a crash never loses it
+    def put(self, key, prompt, response):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO llama_cache (key, prompt, response, last_used) VALUES (?, ?, ?, ?)",
+                (key, prompt, response, time.time())
+            )
+            self.evict()
+
+    # Function to drop the least recently used entries beyond max_entries
+    def evict(self):
+        count = self.connection.execute("SELECT COUNT(*) FROM llama_cache").fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM llama_cache WHERE key IN (SELECT key FROM llama_cache ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM llama_cache").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+# Generates sample values off the step critical path.
+# Uncached fields are answered by the LLM on a background thread while the caller immediately
+# gets a heuristic value, so browser actions and LLM inference overlap. A single generation
+# thread is used because one model instance cannot serve concurrent completions. With a batch
+# size above one, all uncached fields of a page are asked for in a single grammar-constrained
+# JSON prompt, so the prompt-processing cost is paid once per page instead of once per field.
+# Without a load_llama function only cached answers and heuristic values are used.
+class SampleValueGenerator:
+    def __init__(self, llama_cache, load_llama, batch_size=1):
+        self.llama_cache = llama_cache
+        self.load_llama = load_llama
+        self.batch_size = max(1, batch_size)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm")
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.known_keys = set()
+        self.heuristic_values_used = 0
+
+        # Generation throughput counters
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.values_generated = 0
+
+    # Function to mark a field for generation, returning its key and whether the caller should generate it
+    def claim(self, kind, signature):
+        key = get_signature_key(kind, signature)
+        with self.lock:
+            if key in self.known_keys or key in self.pending:
+                return key, False
+        if self.llama_cache.contains(key):
+            with self.lock:
+                self.known_keys.add(key)
+            return key, False
+        if self.load_llama is None:
+            return key, False
+
+        with self.lock:
+            if key in self.pending:
+                return key, False
+            self.pending.add(key)
+        return key, True
+
+    # Function to queue LLM generation for a field unless it is cached or already queued
+    def prefetch(self, kind, signature):
+        key, should_generate = self.claim(kind, signature)
+        if should_generate:
+            self.executor.submit(self.generate, key, build_messages(kind, signature))
+        return key
+
+    # Function to queue LLM generation for all fields of a page, batching them when enabled
+    def prefetch_fields(self, fields):
+        entries = []
+        for kind, signature in fields:
+            key, should_generate = self.claim(kind, signature)
+            if should_generate:
+                entries.append((key, kind, signature))
+
+        for index in range(0, len(entries), self.batch_size):
+            batch = entries[index:index + self.batch_size]
+            if len(batch) == 1:
+                key, kind, signature = batch[0]
+                self.executor.submit(self.generate, key, build_messages(kind, signature))
+            else:
+                self.executor.submit(self.generate_batch, batch)
+
+    # Function to return the cached LLM value for a field, or a heuristic value while the LLM answer is pending
+    def get_value(self, kind, signature):
+        key = self.prefetch(kind, signature)
+        with self.lock:
+            is_known = key in self.known_keys
+        if is_known:
+            value = self.llama_cache.get(key)
+            if value is not None:
+                print(f"Using cached LLM value for field {describe_field_signature(signature)}: {value}")
+                return value
+            # The entry was evicted, so let the next prefetch generate it again
+            with self.lock:
+                self.known_keys.discard(key)
+        else:
+            # The answer is not cached yet, which is a miss even though the cache was not read
+            self.llama_cache.record_miss()
+
+        self.heuristic_values_used += 1
+        value = get_heuristic_value(kind, signature)
+        if self.load_llama is None:
+            print(f"Using rule-based value for field {describe_field_signature(signature)}: {value}")
+        else:
+            print(f"Using heuristic value for field {describe_field_signature(signature)} while the LLM answer is pending: {value}")
+        return value
+
+    # Function to call the model and record its throughput
+    def complete(self, messages, grammar=None):
+        start_time = time.perf_counter()
+        if grammar is None:
+            response = self.load_llama().create_chat_completion(messages=messages)
+        else:
+            response = self.load_llama().create_chat_completion(messages=messages, grammar=grammar)
+        elapsed = time.perf_counter() - start_time
+
+        usage = response.get('usage') or {}
+        with self.lock:
+            self.llm_calls += 1
+            self.llm_seconds += elapsed
+            self.prompt_tokens += usage.get('prompt_tokens', 0)
+            self.completion_tokens += usage.get('completion_tokens', 0)
+        return response['choices'][0]['message']['content'].strip()
+
+    # Function to store a generated value and make it available to get_value
+    def store(self, key, prompt, value):
+        self.llama_cache.put(key, prompt, value)
+        with self.lock:
+            self.known_keys.add(key)
+            self.values_generated += 1
+
+    # Function run on the generation thread to ask the LLM about one field and cache the answer
+    def generate(self, key, messages):
+        try:
+            response_str = self.complete(messages)
+            print("Question: " + messages[0]['content'])
+            print("Answer: " + response_str)
+
+            # Extract the part in double-quotes
+            match = re.search(r'"([^"]*)"', response_str)
+            if match:
+                response_str = match.group(1)
+
+            self.store(key, messages[0]['content'], response_str)
+        except Exception as e:
+            print(f"Error calling LLM: {e}")
+        finally:
+            with self.lock:
+                self.pending.discard(key)
+
+    # Function run on the generation thread to ask the LLM about several fields in one prompt
+    def generate_batch(self, batch):
+        field_ids = [f"f{index}" for index in range(len(batch))]
+        messages = build_batch_messages([(field_id, kind, signature) for field_id, (_, kind, signature) in zip(field_ids, batch)])
+        try:
+            response_str = self.complete(messages, build_batch_grammar(field_ids))
+            print("Question: " + messages[0]['content'])
+            print("Answer: " + response_str)
+            values = json.loads(response_str)
+        except Exception as e:
+            # Fall back to asking for each field on its own
+            print(f"Error calling LLM for a batch of {len(batch)} fields, retrying them one by one: {e}")
+            for key, kind, signature in batch:
+                self.generate(key, build_messages(kind, signature))
+            return
+
+        for field_id, (key, kind, signature) in zip(field_ids, batch):
+            try:
+                value = values.get(field_id)
+                if isinstance(value, str):
+                    self.store(key, build_messages(kind, signature)[0]['content'], value)
+            except Exception as e:
+                print(f"Error caching LLM value for field {describe_field_signature(signature)}: {e}")
+            finally:
+                with self.lock:
+                    self.pending.discard(key)
+
+    # Function to block until every queued generation has finished
+    def wait_until_idle(self):
+        # The single generation thread runs jobs in order, so an empty job finishes last
+        self.executor.submit(lambda: None).result()
+
+    def stats(self):
+        stats = self.llama_cache.stats()
+        with self.lock:
+            stats["pending"] = len(self.pending)
+            stats["llm_calls"] = self.llm_calls
+            stats["llm_seconds"] = self.llm_seconds
+            stats["prompt_tokens"] = self.prompt_tokens
+            stats["completion_tokens"] = self.completion_tokens
+            stats["values_generated"] = self.values_generated
+        stats["heuristic_values_used"] = self.heuristic_values_used
+        stats["tokens_per_second"] = (self.prompt_tokens + self.completion_tokens) / self.llm_seconds if self.llm_seconds else 0.0
+        stats["values_per_second"] = self.values_generated / self.llm_seconds if self.llm_seconds else 0.0
+        return stats
+
+    def close(self):
+        # Drop queued generations; an answer that is already being generated is still cached
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+# Typical form fields used to compare the per-field and batched generation paths
+benchmark_fields = [
+    ("input_text", {"type": "email", "name": "email", "label": "email address"}),
+    ("input_text", {"type": "password", "name": "password", "label": "password"}),
+    ("input_text", {"type": "text", "name": "first name", "label": "first name"}),
+    ("input_text", {"type": "text", "name": "last name", "label": "last name"}),
+    ("input_text", {"type": "text", "name": "phone", "placeholder": "(555) 555-5555"}),
+    ("input_text", {"type": "text", "name": "address", "label": "street address"}),
+    ("input_text", {"type": "text", "name": "city", "label": "city"}),
+    ("input_text", {"type": "text", "name": "zip", "pattern": "[0-9]{5}", "maxlength": "5"}),
+    ("input_text", {"type": "text", "name": "company", "label": "company name"}),
+    ("input_text", {"type": "text", "name": "website", "placeholder": "https://"}),
+    ("enter_date", {"type": "date", "name": "birth date", "label": "date of birth", "max": "2010-12-31"}),
+    ("enter_date", {"type": "date", "name": "start date", "label": "start date", "min": "2024-01-01"})
+]
+
+# Function to generate values for a set of fields with a cold cache and report the throughput
+def benchmark_generation(load_llama, fields, batch_size):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        llama_cache = LlamaCache(os.path.join(temp_dir, "benchmark.sqlite"))
+        generator = SampleValueGenerator(llama_cache, load_llama, batch_size)
+        start_time = time.perf_counter()
+        generator.prefetch_fields(fields)
+        generator.wait_until_idle()
+        stats = generator.stats()
+        stats["wall_seconds"] = time.perf_counter() - start_time
+        generator.close()
+        llama_cache.close()
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-field and batched LLM sample value generation")
+    parser.add_argument("--batch-size", type=int, default=len(benchmark_fields), help="Number of fields per batched prompt")
+    args = parser.parse_args()
+
+    from Explore import download_model, load_llama
+
+    download_model()
+    load_llama()  # Load the model up front so it is not counted in either run
+
+    results = {
+        "per-field": benchmark_generation(load_llama, benchmark_fields, 1),
+        "batched": benchmark_generation(load_llama, benchmark_fields, args.batch_size)
+    }
+
+    print(f"{'path':<10} {'llm calls':>9} {'prompt tok':>10} {'compl tok':>9} {'llm s':>8} {'tokens/s':>9} {'values':>6} {'values/s':>9}")
+    for path, stats in results.items():
+        print(f"{path:<10} {stats['llm_calls']:>9} {stats['prompt_tokens']:>10} {stats['completion_tokens']:>9} {stats['llm_seconds']:>8.2f} {stats['tokens_per_second']:>9.1f} {stats['values_generated']:>6} {stats['values_per_second']:>9.2f}")
@@ -0,0 +1,202 @@
+# Step traces recorded while exploring, and the Selenium and UFT scripts generated from them
+
+import argparse
+import json
+import os
+import re
+import time
+import uuid
+
+# Function to quote a string for a generated Python statement; quotes and backslashes are escaped
+def python_string(text):
+    return json.dumps(text)
+
+# Function to quote a string for a generated VBScript statement, where quotes are doubled
+def vb_string(text):
+    return '"' + text.replace('"', '""') + '"'
+
+# Function to build the Selenium and UFT statements for an action
+def get_action_strings(action_name, locator, value=""):
+    find = f'driver.find_element(By.XPATH, {python_string(locator)})'
+    page = 'Browser("browser_name").Page("page_name")'
+    if action_name == "navigate":
+        return (f'driver.get({python_string(value)})',
+                f'Browser("browser_name").Navigate {vb_string(value)}')
+    if action_name == "click":
+        return (f'{find}.click()',
+                f'{page}.WebButton({vb_string("xpath:=" + locator)}).Click')
+    if action_name == "input_text":
+        return (f'element = {find}; element.clear(); element.send_keys({python_string(value)})',
+                f'{page}.WebEdit({vb_string("xpath:=" + locator)}).Set {vb_string(value)}')
+    if action_name == "scroll":
+        return (f'driver.execute_script("window.scrollBy(0, {int(value)});")',
+                f'{page}.Object.parentWindow.scrollBy 0, {int(value)}')
+    if action_name == "select_option":
+        return (f'element = {find}; Select(element).select_by_value({python_string(value)})',
+                f'{page}.WebList({vb_string("xpath:=" + locator)}).Select {vb_string(value)}')
+    if action_name == "enter_date":
+        return (f'{find}.send_keys({python_string(value)})',
+                f'{page}.WebEdit({vb_string("xpath:=" + locator)}).Set {vb_string(value)}')
+    if action_name == "select_radio":
+        return (f'{find}.click()',
+                f'{page}.WebRadioGroup({vb_string("xpath:=" + locator)}).Select')
+    if action_name == "accept_alert":
+        return ('driver.switch_to.alert.accept()',
+                f'{page}.Dialog("micClass:=Dialog").Close micOk')
+    if action_name == "dismiss_alert":
+        return ('driver.switch_to.alert.dismiss()',
+                f'{page}.Dialog("micClass:=Dialog").Close micCancel')
+    raise ValueError(f"Unknown action: {action_name}")
+
+# Define the actions a trace can hold and whether each needs a locator and a value
+action_fields = {
+    "navigate": (False, True),
+    "click": (True, False),
+    "input_text": (True, False),
+    "scroll": (False, True),
+    "select_option": (True, False),
+    "enter_date": (True, False),
+    "select_radio": (True, False),
+    "accept_alert": (False, False),
+    "dismiss_alert": (False, False)
+}
+
+# Define the Selenium statements written by get_action_strings, used to read scripts generated before traces existed.
+# Strings are double-quoted and escaped by current versions; older versions wrote locators in single quotes and values unescaped.
+string_pattern = r"""('.*'|".*")"""
+script_patterns = [
+    ("navigate", re.compile(rf'driver\.get\((?P<value>{string_pattern})\)')),
+    ("input_text", re.compile(rf"element = driver\.find_element\(By\.XPATH, (?P<locator>{string_pattern})\); element\.clear\(\); element\.send_keys\((?P<value>{string_pattern})\)")),
+    ("select_option", re.compile(rf"element = driver\.find_element\(By\.XPATH, (?P<locator>{string_pattern})\); Select\(element\)\.select_by_value\((?P<value>{string_pattern})\)")),
+    ("click", re.compile(rf"driver\.find_element\(By\.XPATH, (?P<locator>{string_pattern})\)\.click\(\)")),
+    ("enter_date", re.compile(rf"driver\.find_element\(By\.XPATH, (?P<locator>{string_pattern})\)\.send_keys\((?P<value>{string_pattern})\)")),
+    ("scroll", re.compile(r'driver\.execute_script\("window\.scrollBy\(0, (?P<value>-?\d+)\);"\)')),
+    ("accept_alert", re.compile(r"(driver\.switch_to\.)?alert\.accept\(\)")),
+    ("dismiss_alert", re.compile(r"(driver\.switch_to\.)?alert\.dismiss\(\)"))
+]
+
+# Function to read a string of a generated statement, escaped or written by an older version
+def read_string(text):
+    if text.startswith('"'):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            pass
+    return text[1:-1]
+
+# Append-only JSONL trace of one episode.
+# Each action is written as one JSON line the moment it happens, holding the action type,
+# locator, value, the URL it was performed on and its timing. The file is line-buffered, so a
+# crash or kill keeps every step taken so far, and the random part of the trace id keeps
+# parallel episodes from overwriting each other.
+class TraceWriter:
+    def __init__(self, output_dir, worker_index=0):
+        self.trace_id = f"{time.strftime('%Y%m%d%H%M%S')}_w{worker_index}_{uuid.uuid4().hex[:8]}"
+        self.path = os.path.join(output_dir, f"Trace_{self.trace_id}.jsonl")
+        self.file = open(self.path, "w", buffering=1)
+        self.records = 0
+
+    def write(self, action_name, locator="", value="", url="", duration=0.0):
+        record = {
+            "step": self.records,
+            "time": round(time.time(), 3),
+            "duration": round(duration, 4),
+            "action": action_name,
+            "locator": locator,
+            "value": value,
+            "url": url
+        }
+        self.file.write(json.dumps(record) + "\n")
+        self.records += 1
+        return record
+
+    def close(self, delete=False):
+        self.file.close()
+        if delete:
+            os.remove(self.path)
+
+# Function to write a complete trace, such as a minimized copy of a recorded one
+def write_trace(path, records):
+    with open(path, "w") as f:
+        for step, record in enumerate(records):
+            f.write(json.dumps(dict(record, step=step)) + "\n")
+
+# Function to read the records of a trace, ignoring a last line cut off by a crash
+def read_trace(path):
+    records = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return records
+
+# Function to check that a trace record is an action that can be replayed, raising ValueError otherwise
+def validate_record(record):
+    action_name = record.get("action")
+    if action_name not in action_fields:
+        raise ValueError(f"Unknown action: {action_name}")
+    needs_locator, needs_value = action_fields[action_name]
+    locator = record.get("locator", "")
+    value = record.get("value", "")
+    if not isinstance(locator, str) or not isinstance(value, str):
+        raise ValueError(f"Locator and value of {action_name} must be strings")
+    if needs_locator and not locator:
+        raise ValueError(f"{action_name} needs a locator")
+    if needs_value and not value:
+        raise ValueError(f"{action_name} needs a value")
+    if action_name == "scroll" and not re.fullmatch(r"-?\d+", value):
+        raise ValueError(f"Scroll amount must be a whole number: {value}")
+
+# Function to read the actions of a generated Selenium steps script without executing it
+def read_script(path):
+    records = []
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            for action_name, pattern in script_patterns:
+                match = pattern.fullmatch(line)
+                if match:
+                    fields = match.groupdict()
+                    locator = read_string(fields["locator"]) if fields.get("locator") else ""
+                    value = fields.get("value") or ""
+                    if action_name != "scroll" and value:
+                        value = read_string(value)
+                    records.append({"action": action_name, "locator": locator, "value": value})
+                    break
+            else:
+                raise ValueError(f"Line {line_number} is not a generated action: {line}")
+    return records
+
+# Function to generate the Selenium and UFT scripts of a trace next to it, returning their paths
+def export_scripts(trace_path):
+    trace_dir, trace_file = os.path.split(trace_path)
+    trace_id = os.path.splitext(trace_file)[0]
+    if trace_id.startswith("Trace_"):
+        trace_id = trace_id[len("Trace_"):]
+
+    statements = [get_action_strings(record["action"], record["locator"], record["value"]) for record in read_trace(trace_path)]
+
+    selenium_steps_file = os.path.join(trace_dir, f"Steps_{trace_id}.py")
+    with open(selenium_steps_file, "w") as actions_file:
+        for action_str, _ in statements:
+            actions_file.write(f"{action_str}\n")
+
+    uft_steps_file = os.path.join(trace_dir, f"UFT_Steps_{trace_id}.vb")
+    with open(uft_steps_file, "w") as uft_actions_file:
+        for _, uft_action_str in statements:
+            uft_actions_file.write(f"{uft_action_str}\n")
+
+    return selenium_steps_file, uft_steps_file
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate Selenium and UFT scripts from exploration traces")
+    parser.add_argument("traces", nargs="+", help="Trace_*.jsonl files to convert")
+    args = parser.parse_args()
+
+    for trace_path in args.traces:
+        selenium_steps_file, uft_steps_file = export_scripts(trace_path)
+        print(f"Generated {selenium_steps_file} and {uft_steps_file}")
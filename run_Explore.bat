@@ -33,7 +33,7 @@ echo Running Python script: Explore.py
 echo.
 
 REM Run your Python script within the virtual environment
-python Explore.py
+python Explore.py %*
 
 REM Check the exit code of the script
 if %errorlevel% neq 0 (
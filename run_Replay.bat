@@ -33,7 +33,7 @@ echo Running Python script: Replay.py
 echo.
 
 REM Run your Python script within the virtual environment
-python Replay.py
+python Replay.py %*
 
 REM Check the exit code of the script
 if %errorlevel% neq 0 (